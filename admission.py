@@ -0,0 +1,102 @@
+import threading
+from flask import g, request
+from werkzeug.exceptions import ServiceUnavailable
+from streaming import stream_open
+
+# <--- ENDPOINT GROUP --->
+# At most `concurrency` requests run at once; up to `queue` more wait (for at
+# most `timeout` seconds) for a slot. Anything beyond that is turned away
+# straight away instead of adding to everyone's latency.
+class EndpointGroup:
+    def __init__(self, name, concurrency, queue, timeout):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            if self.active < self.concurrency:
+                self.active += 1
+                return True
+            if self.waiting >= self.queue:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            try:
+                admitted = self._condition.wait_for(lambda: self.active < self.concurrency, self.timeout)
+            finally:
+                self.waiting -= 1
+            if not admitted:
+                self.timed_out += 1
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {"concurrency": self.concurrency, "queue": self.queue, "active": self.active,
+                    "waiting": self.waiting, "rejected": self.rejected, "timed_out": self.timed_out}
+
+# <--- ADMISSION CONTROL --->
+# Expensive endpoints (login/signup hashing, search, writes) are put in groups
+# from ADMISSION_GROUPS, each with its own concurrency cap and wait queue, per
+# worker process. Endpoints outside every group are never held back, so under
+# overload lessons and the index stay fast while the grouped endpoints shed
+# load with a 503 and Retry-After.
+class AdmissionControl:
+    def __init__(self, app=None):
+        self.enabled = True
+        self.groups = {}
+        self.by_endpoint = {}
+        self.retry_after = 1
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ADMISSION_CONTROL_ENABLED', True)
+        self.retry_after = app.config.get('ADMISSION_RETRY_AFTER', self.retry_after)
+        self.groups = {}
+        self.by_endpoint = {}
+        for name, options in (app.config.get('ADMISSION_GROUPS') or {}).items():
+            group = EndpointGroup(name, options["concurrency"], options["queue"], options.get("timeout", 1.0))
+            self.groups[name] = group
+            for endpoint in options["endpoints"]:
+                self.by_endpoint[endpoint] = group
+
+        app.before_request_funcs.setdefault(None, []).insert(0, self.admit)
+        app.teardown_request(self.release)
+        app.extensions['admission_control'] = self
+
+    def admit(self):
+        if not self.enabled:
+            return
+        group = self.by_endpoint.get(request.endpoint)
+        if group is None:
+            return
+        if not group.acquire():
+            raise ServiceUnavailable(retry_after=self.retry_after)
+        g.admission_group = group
+
+    # A streamed page keeps its slot until the last chunk is sent
+    def release(self, exc=None):
+        if stream_open():
+            return
+        group = g.pop("admission_group", None)
+        if group is not None:
+            group.release()
+
+    def stats(self):
+        return {name: group.stats() for name, group in self.groups.items()}
+
+admission_control = AdmissionControl()
@@ -1,41 +1,79 @@
-from flask import render_template, redirect, url_for, flash, request
-import os
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, current_app, render_template, redirect, url_for, flash, request, abort, make_response
 from flask_login import LoginManager, login_user, login_required, current_user, logout_user
 from flask_wtf.csrf import CSRFProtect
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
 from web_forms import SignUpForm, LoginForm, UpdateForm, PostForm, SearchForm
-from models import Posts, Users, db, app
+from models import Posts, Users, db, migrate, ckeditor, POST_CARD_COLUMNS, POST_DETAIL_COLUMNS
+from config import Config
 from valid_url import is_valid
-
-csrf = CSRFProtect(app)
-# Secret key - NEEDS TO BE CHANGED FOR SECURITY REASONS
-secret = os.getenv("FORM_SECRET_KEY")
-app.config['SECRET_KEY'] = secret
+from database import read_only, engine_config, configure_engines
+from pagination import paginate_keyset, decode_cursor
+from search_index import search_posts
+from user_cache import user_cache
+from metrics import (metrics, user_cache_collector, fragment_cache_collector, password_hasher_collector,
+                     rate_limiter_collector, admission_collector, live_feed_collector,
+                     typeahead_collector)
+from lessons import lesson_pages
+from fragment_cache import fragment_cache
+from avatars import avatars
+from static_assets import static_assets
+from templating import init_templating
+from streaming import init_streaming, render_streamed, streaming_enabled
+from startup import StartupProfile, startup_profile_command
+from rate_limit import rate_limiter
+from admission import admission_control
+from profiler import request_profiler
+from passwords import password_hasher, HashingBusy
+from progress import progress_buffer, clean_lesson_ids, progress_for, stored_progress_for, save_changes
+from lesson_stats import record_new_user, completion_stats, backfill_lesson_stats_command
+from bulk_data import init_bulk_data
+from live_feed import live_feed
+from typeahead import typeahead_index
+
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+csrf = CSRFProtect()
 
 # Initialise LoginManager
-login_manager = LoginManager(app)
+login_manager = LoginManager()
 
 login_manager.login_view = "login"
 login_manager.login_message_category = "info"
 
+# Views and error handlers are collected here and registered on each app
+# made by create_app()
+ROUTES = []
+ERROR_HANDLERS = []
+
+def route(rule, **options):
+    def decorator(view):
+        ROUTES.append((rule, view, options))
+        return view
+    return decorator
+
+def errorhandler(code):
+    def decorator(handler):
+        ERROR_HANDLERS.append((code, handler))
+        return handler
+    return decorator
+
 # <--- INDEX PAGE --->
-@app.route('/')
+@route('/')
 def index():
     if current_user.is_authenticated:
         return redirect(url_for("dashboard"))
     return render_template("index.html")
 
 # <--- SIGNUP PAGE --->
-@app.route('/signup', methods=['GET', 'POST'])
+@route('/signup', methods=['GET', 'POST'])
 def signup():
     form = SignUpForm()
 
     if form.validate_on_submit():
-        hashed_pw = generate_password_hash(
-            form.password.data,
-            method="pbkdf2:sha256",
-            salt_length=8
-        )
+        hashed_pw = password_hasher.hash(form.password.data)
 
         user = Users(
             name=form.name.data, 
@@ -44,14 +82,16 @@ def signup():
         )
         
         db.session.add(user)
+        record_new_user()
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash("Your Account was Successfully Made", "success")
         return redirect(url_for("login"))
     
     return render_template("signup.html", form=form)
 
 # <--- LOGIN PAGE --->
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for("dashboard"))
@@ -59,7 +99,11 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = Users.query.filter_by(email=form.email.data).first()
-        if user and check_password_hash(user.password, form.password.data):
+        if user and password_hasher.verify(user.password, form.password.data):
+            # Stored with an older method or cost: upgrade it while we have the password
+            if password_hasher.needs_rehash(user.password):
+                user.password = password_hasher.hash(form.password.data)
+                db.session.commit()
             login_user(user)
             return redirect(url_for("dashboard"))
         else:
@@ -70,45 +114,81 @@ def login():
 # <--- LOAD USER --->
 @login_manager.user_loader
 def load_user(user_id):
-    return Users.query.get(int(user_id))
+    return user_cache.get(int(user_id), lambda id: db.session.get(Users, id))
+
+# <--- USER CACHE STATS --->
+@route('/stats/user_cache')
+@login_required
+def user_cache_stats():
+    return user_cache.stats()
+
+# <--- LESSON COMPLETION STATS --->
+# Completions and percentages per lesson, from the lesson_stats counters
+@route('/stats/lessons')
+@login_required
+@read_only
+def lesson_completion_stats():
+    return completion_stats()
 
 # <--- LOGOUT VIEW --->
-@app.route('/logout')
+@route('/logout')
 @login_required
 def logout():
     logout_user()
     flash("You have been logged out", "success")
     return redirect(url_for("login"))
 
+# <--- PAGINATED POSTS --->
+def paginate_posts(query, stream=False):
+    before = request.args.get("before")
+    after = request.args.get("after")
+    before_key = decode_cursor(before) if before else None
+    after_key = decode_cursor(after) if after else None
+    if (before and before_key is None) or (after and after_key is None):
+        abort(400)
+    return paginate_keyset(query, Posts.date_posted, Posts.id,
+                           per_page=current_app.config['POSTS_PER_PAGE'],
+                           before=before_key, after=after_key, stream=stream)
+
 # <--- COMMUNITY PAGE --->
-@app.route('/posts')
+@route('/posts')
 @login_required
+@read_only
 def posts():
-    # Grab all posts from DB
-    posts = Posts.query.order_by(Posts.date_posted.desc()).all()
-    return render_template("posts.html", posts=posts, current_user=current_user)
+    # One page of posts, read from the cursor while the cards render
+    page = paginate_posts(Posts.query.with_entities(*POST_CARD_COLUMNS), stream=streaming_enabled())
+    return render_streamed("posts.html", posts=page, page=page, current_user=current_user,
+                           live_since=live_feed.position())
 
 # <--- VIEW POST PAGE --->
-@app.route('/posts/<int:id>')
+@route('/posts/<int:id>')
 @login_required
+@read_only
 def post(id):
-    post = Posts.query.get_or_404(id)
-    post.profile_picture = (post.profile_picture)[0:7]
+    post = db.session.execute(db.select(*POST_DETAIL_COLUMNS).where(Posts.id == id)).first()
+    if post is None:
+        abort(404)
     return render_template("post.html", post=post)
 
 # <--- ADD POST PAGE --->
-@app.route('/add-post', methods=['GET', 'POST'])
+@route('/add-post', methods=['GET', 'POST'])
 @login_required
 def add_post():
     form = PostForm()
 
     if form.validate_on_submit():
 
-        number_of_posts = Posts.query.filter_by(user_id=current_user.id).count()
-        print(number_of_posts)
-
-        if number_of_posts >= 5:
-            flash("You cannot have more than 5 posts due to spam policies", "danger")
+        # Claim a slot and insert in one transaction: the conditional UPDATE
+        # takes the write lock, so two concurrent submits can't both pass
+        limit = current_app.config['MAX_POSTS_PER_USER']
+        claimed = db.session.execute(
+            db.update(Users)
+            .where(Users.id == current_user.id, Users.post_count < limit)
+            .values(post_count=Users.post_count + 1)
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
+            flash(f"You cannot have more than {limit} posts due to spam policies", "danger")
             return redirect(url_for('dashboard'))
 
         post = Posts(title=form.title.data.strip(),
@@ -122,6 +202,8 @@ def add_post():
         # Add post data to db
         db.session.add(post)
         db.session.commit()
+        live_feed.publish("created", post.id, post)
+        typeahead_index.add_post(post)
 
         flash("Blog Post Submitted Successfully", "success")
         return redirect(url_for('posts'))
@@ -129,7 +211,7 @@ def add_post():
     return render_template("add_post.html", form=form)
 
 # <--- EDIT POSTS PAGE --->
-@app.route('/posts/edit/<int:id>', methods=['GET', 'POST'])
+@route('/posts/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
 def edit_post(id):
     post = Posts.query.get_or_404(id)
@@ -140,9 +222,13 @@ def edit_post(id):
     if form.validate_on_submit():
         post.title = form.title.data.strip()
         post.content = form.content.data.strip()
+        post.version = (post.version or 1) + 1
         # Update db
         db.session.add(post)
         db.session.commit()
+        fragment_cache.invalidate_post(post.id)
+        live_feed.publish("edited", post.id, post)
+        typeahead_index.add_post(post)
         flash("Post has been Updated Successfully", "success")
         return redirect(url_for('post', id=post.id))
     
@@ -152,7 +238,7 @@ def edit_post(id):
     return render_template("edit_post.html", form=form)
 
 # <--- DELETE POSTS PAGE --->
-@app.route('/posts/delete/<int:id>')
+@route('/posts/delete/<int:id>')
 @login_required
 def delete_post(id):
     post = Posts.query.get_or_404(id)
@@ -161,7 +247,15 @@ def delete_post(id):
         return redirect(url_for('dashboard'))
     try:
         db.session.delete(post)
+        db.session.execute(
+            db.update(Users)
+            .where(Users.id == post.user_id, Users.post_count > 0)
+            .values(post_count=Users.post_count - 1)
+        )
         db.session.commit()
+        fragment_cache.invalidate_post(id)
+        live_feed.publish("deleted", id)
+        typeahead_index.remove_post(id)
         flash("Blog post was Deleted", "success")
         return redirect(url_for('profile'))
     except:
@@ -169,44 +263,59 @@ def delete_post(id):
         return redirect(url_for('profile'))
 
 # <--- USER DASHBOARD PAGE --->
-@app.route('/dashboard')
+@route('/dashboard')
 @login_required
 def dashboard():
-    progress = current_user.progress or []
+    progress = progress_for(current_user, progress_buffer)
     return render_template("dashboard.html", current_user=current_user, user_progress=set(progress))
 
 # <--- USER LESSONS PAGE --->
-@app.route('/dashboard/<string:lesson>')
+@route('/dashboard/<string:lesson>')
 def lesson(lesson):
     # To avoid template injection for security reasons
     if is_valid(lesson):
-        return render_template(f"/lessons/{lesson}.html")
+        return lesson_pages.response(lesson)
     else:
-        return render_template("errors/404.html")
+        return render_template("errors/404.html"), 404
 
 # <--- SAVE PROGRESS --->
+# Takes {"added": [...], "removed": [...]} lesson events; the old full-list
+# {"completed_lessons": [...]} payload is still accepted and diffed
 @csrf.exempt
-@app.route("/save_progress", methods=['POST'])
+@route("/save_progress", methods=['POST'])
 @login_required
 def save_progress():
     if not request.is_json:
         return {"success": False, "error": "JSON required"}, 400
-    data = request.json
-    current_user.progress = data.get("completed_lessons", [])
-    db.session.commit()
-    return {"success": True}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return {"success": False, "error": "JSON object required"}, 400
+
+    if "completed_lessons" in data:
+        completed = clean_lesson_ids(data["completed_lessons"])
+        if completed is None:
+            return {"success": False, "error": "Invalid lesson list"}, 400
+        current = set(stored_progress_for(current_user.id, progress_buffer))
+        added = [lesson for lesson in completed if lesson not in current]
+        removed = list(current - set(completed))
+    else:
+        added = clean_lesson_ids(data.get("added", []))
+        removed = clean_lesson_ids(data.get("removed", []))
+        if added is None or removed is None:
+            return {"success": False, "error": "Invalid lesson list"}, 400
+
+    changed = save_changes(current_user.id, added, removed, progress_buffer)
+    return {"success": True, "changed": changed}
 
-@app.route('/profile')
+@route('/profile')
 @login_required
+@read_only
 def profile():
-    posts = (Posts.query
-             .filter_by(user_id = current_user.id)
-             .order_by(Posts.date_posted.desc())
-             .all())
-    return render_template("profile.html", current_user=current_user, posts=posts)
+    page = paginate_posts(Posts.query.with_entities(*POST_CARD_COLUMNS).filter(Posts.user_id == current_user.id))
+    return render_template("profile.html", current_user=current_user, posts=page, page=page)
 
 # Update database record
-@app.route('/update_profile/<int:id>', methods=['GET', 'POST'])
+@route('/update_profile/<int:id>', methods=['GET', 'POST'])
 @login_required
 def update(id):
     if current_user.id != id:
@@ -222,6 +331,7 @@ def update(id):
         name_to_update.aspiring_job = form.aspiring_job.data.strip()
         try:
             db.session.commit()
+            user_cache.invalidate(id)
             flash("User updated successfully!", "success")
             return redirect(url_for("profile"))
         except:
@@ -230,63 +340,180 @@ def update(id):
     else:
         return render_template("update.html", form=form, name_to_update=name_to_update)
 
-@app.context_processor
-def base():
-    form = SearchForm()
-    return dict(form=form)
-
-@app.route('/search', methods=["POST", "GET"])
+@route('/search', methods=["POST", "GET"])
+@read_only
 def search():
     form = SearchForm()
-    posts = Posts.query
     if form.validate_on_submit():
-        search_term = f"%{form.searched.data.strip()}%"   # build the pattern safely
-        posts = posts.filter(Posts.content.like(search_term))
-        posts = posts.order_by(Posts.title).all()
-        return render_template(
-            "search.html", 
-            form=form, 
-            searched=form.searched.data, 
-            posts=posts
-        )
-
-    return redirect(url_for("posts"))
+        searched = form.searched.data.strip()
+    else:
+        # Result pages link back here with the term in the query string
+        searched = request.args.get("q", "").strip()
+    if not searched:
+        return redirect(url_for("posts"))
+
+    page_number = request.args.get("page", 1, type=int)
+    if page_number < 1:
+        abort(400)
+    results = search_posts(searched, page=page_number,
+                           per_page=current_app.config['SEARCH_RESULTS_PER_PAGE'],
+                           stream=streaming_enabled())
+    return render_streamed(
+        "search.html", 
+        form=form, 
+        searched=searched, 
+        posts=results,
+        page=results
+    )
 
 # 400 – Bad Request
-@app.errorhandler(400)
+@errorhandler(400)
 def bad_request(e):
     return render_template("errors/400.html"), 400
 
 # 401 – Unauthorized
-@app.errorhandler(401)
+@errorhandler(401)
 def unauthorized(e):
     return render_template("errors/401.html"), 401
 
 # 403 – Forbidden
-@app.errorhandler(403)
+@errorhandler(403)
 def forbidden(e):
     return render_template("errors/403.html"), 403
 
 # 404 – Not Found
-@app.errorhandler(404)
+@errorhandler(404)
 def page_not_found(e):
     return render_template("errors/404.html"), 404
 
 # 405 – Method Not Allowed
-@app.errorhandler(405)
+@errorhandler(405)
 def method_not_allowed(e):
     return render_template("errors/405.html"), 405
 
 # 429 – Too Many Requests
-@app.errorhandler(429)
+@errorhandler(429)
 def too_many_requests(e):
-    return render_template("errors/429.html"), 429
+    response = make_response(render_template("errors/429.html"), 429)
+    if getattr(e, "retry_after", None) is not None:
+        response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+# 503 – Service Unavailable (admission control is shedding load)
+@errorhandler(503)
+def service_unavailable(e):
+    response = make_response(render_template("errors/503.html"), 503)
+    if getattr(e, "retry_after", None) is not None:
+        response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+# 503 – Password hashing queue is full
+@errorhandler(HashingBusy)
+def hashing_busy(e):
+    response = make_response(render_template("errors/503.html"), 503)
+    response.headers["Retry-After"] = "1"
+    return response
 
 # 500 – Internal Server Error
-@app.errorhandler(500)
+@errorhandler(500)
 def internal_error(e):
     return render_template("errors/500.html"), 500
 
+# <--- APP FACTORY --->
+def create_app(config=None):
+    profile = StartupProfile()
+    profile.add("import app modules", _IMPORT_SECONDS)
+
+    with profile.step("config"):
+        app = Flask(__name__)
+        app.config.from_object(Config)
+        if isinstance(config, dict):
+            app.config.update(config)
+        elif config is not None:
+            app.config.from_object(config)
+        engine_config(app.config)
+        app.extensions['startup_profile'] = profile
+        # Real client addresses from X-Forwarded-For, for the rate limiter
+        if app.config.get('PROXY_FIX_X_FOR'):
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
+    with profile.step("database"):
+        db.init_app(app)
+        configure_engines(app, db)
+        migrate.init_app(app, db)
+
+    with profile.step("extensions"):
+        ckeditor.init_app(app)
+
+        # Concurrency caps per endpoint group, then token buckets on
+        # login/signup/search/save_progress, then the on-demand profiler; each
+        # puts its hook first, so a profiled request includes the rate limiter
+        # and admission control, and all of them run before CSRF/form parsing
+        admission_control.init_app(app)
+        rate_limiter.init_app(app)
+        request_profiler.init_app(app)
+        csrf.init_app(app)
+        login_manager.init_app(app)
+
+        # Password hashing in a bounded process pool
+        password_hasher.init_app(app)
+
+        # Serves current_user from memory instead of a query per request
+        user_cache.init_app(app)
+
+        # Per-endpoint latency and SQL counts, served at /metrics
+        if app.config['METRICS_ENABLED']:
+            metrics.init_app(app, db, collectors=[user_cache_collector(user_cache),
+                                                  fragment_cache_collector(fragment_cache),
+                                                  password_hasher_collector(password_hasher),
+                                                  rate_limiter_collector(rate_limiter),
+                                                  admission_collector(admission_control),
+                                                  live_feed_collector(live_feed),
+                                                  typeahead_collector(typeahead_index)])
+
+        # Lessons are rendered once and revalidated with ETags
+        lesson_pages.init_app(app)
+
+        # Rendered post cards for the feed and profile pages
+        fragment_cache.init_app(app)
+
+        # Content-hashed, resized avatar URLs
+        avatars.init_app(app)
+
+        # Content-hashed, precompressed files under static/
+        static_assets.init_app(app)
+
+        # Coalesces lesson checkbox toggles into one write per user
+        progress_buffer.init_app(app)
+
+        # Feed and search pages are sent while they render, head first
+        init_streaming(app)
+
+        # New, edited and deleted posts pushed to open feed pages (/posts/live)
+        live_feed.init_app(app)
+
+        # Navbar search suggestions from an in-memory prefix index (/search/suggest)
+        typeahead_index.init_app(app)
+
+    with profile.step("routes"):
+        for rule, view, options in ROUTES:
+            app.add_url_rule(rule, view_func=view, **options)
+        for code, handler in ERROR_HANDLERS:
+            app.register_error_handler(code, handler)
+        app.cli.add_command(startup_profile_command)
+        app.cli.add_command(backfill_lesson_stats_command)
+        # NDJSON export/import commands and the token-protected /admin/export
+        init_bulk_data(app)
+
+    # Shared on-disk Jinja bytecode cache and optional template warm-up; last, so
+    # every route and the user loader exist before anything is rendered
+    with profile.step("templates"):
+        init_templating(app)
+
+    if app.config['STARTUP_PROFILE']:
+        profile.log(app.logger)
+    return app
+
 # <-- MUST CHANGE BEFORE PRODUCTION -->
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import random
+import click
+from flask import abort, current_app, send_from_directory, url_for
+
+try:
+    from PIL import Image
+except ImportError:  # variants are optional; originals are served without Pillow
+    Image = None
+
+AVATAR_FOLDER = "static/avatars"
+VARIANT_FOLDER = os.path.join(AVATAR_FOLDER, "variants")
+
+# Display sizes used by the templates (feed thumbnail, profile header); each
+# is built at 1x and 2x for high-DPI screens
+DISPLAY_SIZES = (25, 120)
+VARIANT_FORMATS = ("webp", "png")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def _digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+def list_avatars(folder):
+    return tuple(sorted(name for name in os.listdir(folder) if name.endswith(".png")))
+
+def variant_filename(name, width, ext):
+    return f"{os.path.splitext(name)[0]}-{width}.{ext}"
+
+def build_variants(root, force=False):
+    if Image is None:
+        raise RuntimeError("Pillow is required to build avatar variants")
+    source_folder = os.path.join(root, AVATAR_FOLDER)
+    target_folder = os.path.join(root, VARIANT_FOLDER)
+    os.makedirs(target_folder, exist_ok=True)
+    built = []
+    for name in list_avatars(source_folder):
+        with Image.open(os.path.join(source_folder, name)) as original:
+            original = original.convert("RGB")
+            for size in DISPLAY_SIZES:
+                for width in (size, size * 2):
+                    resized = None
+                    for ext in VARIANT_FORMATS:
+                        target = os.path.join(target_folder, variant_filename(name, width, ext))
+                        if os.path.exists(target) and not force:
+                            continue
+                        if resized is None:
+                            resized = original.resize((width, width), Image.LANCZOS)
+                        if ext == "webp":
+                            resized.save(target, "WEBP", quality=82, method=6)
+                        else:
+                            resized.save(target, "PNG", optimize=True)
+                        built.append(target)
+    return built
+
+# <--- AVATAR MANIFEST --->
+# The avatar files are read once: their names, content hashes and whichever
+# resized variants exist. New rows pick from it in memory, and templates get
+# content-hashed URLs (/avatars/<hash>/<file>) that can be cached forever.
+class AvatarManifest:
+    def __init__(self, app=None):
+        self.avatars = ()
+        self.files = {}
+        self.variants = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if app.config.get('AVATAR_BUILD_VARIANTS', True) and Image is not None:
+            try:
+                build_variants(app.root_path)
+            except OSError as error:
+                app.logger.warning("Could not build avatar variants: %s", error)
+        self.load(app.root_path)
+        app.add_url_rule('/avatars/<digest>/<path:filename>', 'avatar_file', self.serve)
+        app.add_template_global(self.urls, "avatar_urls")
+        app.cli.add_command(build_avatars_command)
+        app.extensions['avatars'] = self
+
+    def load(self, root):
+        source_folder = os.path.join(root, AVATAR_FOLDER)
+        variant_folder = os.path.join(root, VARIANT_FOLDER)
+        self.avatars = list_avatars(source_folder)
+        self.files = {}
+        self.variants = {}
+        for name in self.avatars:
+            self.files[name] = (_digest(os.path.join(source_folder, name)), source_folder)
+            for size in DISPLAY_SIZES:
+                for width in (size, size * 2):
+                    for ext in VARIANT_FORMATS:
+                        filename = variant_filename(name, width, ext)
+                        path = os.path.join(variant_folder, filename)
+                        if os.path.exists(path):
+                            self.files[filename] = (_digest(path), variant_folder)
+                            self.variants[(name, width, ext)] = filename
+
+    # Rows created outside an app (scripts, migrations) still get an avatar
+    def random_avatar(self):
+        if not self.avatars:
+            self.avatars = list_avatars(os.path.join(os.path.dirname(os.path.abspath(__file__)), AVATAR_FOLDER))
+        return f"{AVATAR_FOLDER}/{random.choice(self.avatars)}"
+
+    def _url(self, filename):
+        digest, _ = self.files[filename]
+        return url_for('avatar_file', digest=digest, filename=filename)
+
+    # src/srcset for one avatar at a display size; stored paths look like
+    # "static/avatars/avatar_one.png"
+    def urls(self, path, size):
+        name = os.path.basename(path or "")
+        if name not in self.files:
+            return {"src": "/" + (path or "").lstrip("/"), "srcset": "", "webp": ""}
+
+        def srcset(ext):
+            parts = []
+            for width, density in ((size, "1x"), (size * 2, "2x")):
+                filename = self.variants.get((name, width, ext))
+                if filename is not None:
+                    parts.append(f"{self._url(filename)} {density}")
+            return ", ".join(parts)
+
+        png = self.variants.get((name, size, "png"))
+        return {
+            "src": self._url(png or name),
+            "srcset": srcset("png"),
+            "webp": srcset("webp"),
+        }
+
+    def serve(self, digest, filename):
+        entry = self.files.get(filename)
+        if entry is None or entry[0] != digest:
+            abort(404)
+        response = send_from_directory(os.path.join(current_app.root_path, entry[1]), filename,
+                                       max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+avatars = AvatarManifest()
+
+def get_random_avatar():
+    return avatars.random_avatar()
+
+@click.command("build-avatars")
+@click.option("--force", is_flag=True, help="Rebuild variants that already exist")
+def build_avatars_command(force):
+    """Write resized WebP/PNG avatar variants to static/avatars/variants."""
+    built = build_variants(current_app.root_path, force=force)
+    avatars.load(current_app.root_path)
+    click.echo(f"Built {len(built)} avatar variants")
@@ -0,0 +1,109 @@
+"""Password hashing cost: logins/sec per core at each KDF setting.
+
+    python -m benchmarks.hashing
+    python -m benchmarks.hashing --methods pbkdf2:sha256:600000 scrypt --workers 4
+
+Each method is timed on the current thread (one core), then through a
+PasswordHasher pool with --workers processes fed by that many threads.
+Finally a login is sent through the app with a PASSWORD_HASH_TIMEOUT shorter
+than the hash; exits with status 1 unless it gets a 503 with Retry-After.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_METHODS = [
+    "pbkdf2:sha256:260000",
+    "pbkdf2:sha256:600000",
+    "pbkdf2:sha256:1000000",
+    "scrypt:16384:8:1",
+    "scrypt:32768:8:1",
+]
+
+def logins_per_second(verify, pwhash, password, seconds, threads=1):
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        done = 0
+        while time.perf_counter() < deadline:
+            verify(pwhash, password)
+            done += 1
+        return done
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        total = sum(executor.map(lambda _: worker(), range(threads)))
+    return total / (time.perf_counter() - started)
+
+# A pooled hash slower than PASSWORD_HASH_TIMEOUT must turn into a 503, not a 500
+def login_timeout(method):
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='flaskify-hashing-'), 'app.db')}"
+    os.environ.setdefault("FORM_SECRET_KEY", "benchmark")
+    from app import create_app
+    from models import db, Users
+    from passwords import _hash
+
+    app = create_app({"WTF_CSRF_ENABLED": False, "RATE_LIMIT_ENABLED": False, "METRICS_ENABLED": False,
+                      "PASSWORD_HASH_WORKERS": 1, "PASSWORD_HASH_TIMEOUT": 0.001})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Users(name="Timeout", email="timeout@example.com", password=_hash("x", method, 16)))
+        db.session.commit()
+    response = app.test_client().post("/login", data={"email": "timeout@example.com", "password": "x"})
+    return {"method": method, "status": response.status_code, "retry_after": response.headers.get("Retry-After")}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark password hashing cost settings")
+    parser.add_argument("--methods", nargs="*", default=DEFAULT_METHODS)
+    parser.add_argument("--seconds", type=float, default=2.0, help="time spent on each measurement")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="pool size for the pooled run (0 skips it)")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    from passwords import PasswordHasher, _hash, _verify, normalize_method
+
+    password = "correct horse battery staple"
+    results = {"cpu_count": os.cpu_count(), "workers": args.workers, "methods": {}}
+    for method in args.methods:
+        pwhash = _hash(password, method, 16)
+        started = time.perf_counter()
+        _verify(pwhash, password)
+        result = {
+            "method": normalize_method(method),
+            "login_ms": round((time.perf_counter() - started) * 1000, 2),
+            "logins_per_sec_per_core": round(logins_per_second(_verify, pwhash, password, args.seconds), 2),
+        }
+        if args.workers > 0:
+            hasher = PasswordHasher()
+            hasher.workers = args.workers
+            hasher.queue_size = args.workers
+            hasher.verify(pwhash, password)  # start the pool outside the timing
+            result["pooled_logins_per_sec"] = round(
+                logins_per_second(hasher.verify, pwhash, password, args.seconds, threads=args.workers), 2)
+            hasher._pool.shutdown()
+        results["methods"][method] = result
+        print(f"{method:<26}{result['login_ms']:>10} ms{result['logins_per_sec_per_core']:>10} /s/core"
+              + (f"{result['pooled_logins_per_sec']:>10} /s pooled" if args.workers > 0 else ""),
+              file=sys.stderr)
+
+    failures = 0
+    if args.workers > 0:
+        results["login_timeout"] = login_timeout(args.methods[-1])
+        failures = results["login_timeout"]["status"] != 503 or not results["login_timeout"]["retry_after"]
+        print(f"login past PASSWORD_HASH_TIMEOUT: {results['login_timeout']['status']}"
+              + (" (expected 503)" if failures else ""), file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
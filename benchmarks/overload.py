@@ -0,0 +1,98 @@
+"""Overload test: cheap pages while expensive ones are flooded.
+
+    python -m benchmarks.overload --flood 32 --seconds 5
+    python -m benchmarks.overload --no-admission   # same load, no caps
+
+Serves the app from a threaded WSGI server, floods /search from --flood
+threads and measures lesson pages from --probes threads at the same time.
+Reports p50/p95/p99 and status counts for both as JSON.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.routes import percentile
+
+def hammer(url, deadline, backoff=0.0):
+    latencies, statuses = [], Counter()
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            status = error.code
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses[status] += 1
+        if status == 503:
+            time.sleep(backoff)
+    return latencies, statuses
+
+def summarize(runs):
+    latencies = [ms for run, _ in runs for ms in run]
+    statuses = sum((counts for _, counts in runs), Counter())
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Flood expensive endpoints and time cheap ones")
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--flood", type=int, default=32, help="threads hitting /search")
+    parser.add_argument("--probes", type=int, default=2, help="threads hitting lesson pages")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--search-term", default="flask")
+    parser.add_argument("--backoff", type=float, default=0.1, help="seconds a flood thread waits after a 503")
+    parser.add_argument("--no-admission", action="store_true", help="turn admission control off")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="flaskify-overload-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("FORM_SECRET_KEY", "benchmark")
+
+    from werkzeug.serving import make_server
+    from app import create_app
+    from models import db
+    from benchmarks.seed import seed_database
+
+    app = create_app({"RATE_LIMIT_ENABLED": False, "ADMISSION_CONTROL_ENABLED": not args.no_admission})
+    with app.app_context():
+        db.create_all()
+        seed_database(users=50, posts=args.posts, progress=0.5, seed=1234)
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    deadline = time.perf_counter() + args.seconds
+    with ThreadPoolExecutor(max_workers=args.flood + args.probes) as executor:
+        floods = [executor.submit(hammer, f"{base}/search?q={args.search_term}", deadline, args.backoff)
+                  for _ in range(args.flood)]
+        probes = [executor.submit(hammer, f"{base}/dashboard/lesson_one", deadline) for _ in range(args.probes)]
+        results = {
+            "admission_control": not args.no_admission,
+            "search": summarize([f.result() for f in floods]),
+            "lesson": summarize([f.result() for f in probes]),
+            "groups": app.extensions['admission_control'].stats(),
+        }
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
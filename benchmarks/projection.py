@@ -0,0 +1,89 @@
+"""Feed page loads: full ORM entities against projected read-only rows.
+
+    python -m benchmarks.projection --posts 20000 --page-sizes 10 100 1000
+
+For each page size, loads the newest posts both ways inside a fresh session
+and reports time per load, peak memory allocated and how many objects ended
+up in the session's identity map.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+def measure(app, load, repeat):
+    from models import db
+
+    timings = []
+    for _ in range(repeat):
+        with app.app_context():
+            started = time.perf_counter()
+            load()
+            timings.append((time.perf_counter() - started) * 1000)
+
+    with app.app_context():
+        tracemalloc.start()
+        rows = load()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        tracked = len(db.session.identity_map)
+        del rows
+
+    timings.sort()
+    return {
+        "median_ms": round(timings[len(timings) // 2], 3),
+        "peak_kib": round(peak / 1024, 1),
+        "identity_map": tracked,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare ORM entity loads with projected rows")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--page-sizes", type=int, nargs="*", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="flaskify-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("FORM_SECRET_KEY", "benchmark")
+
+    from app import create_app
+    from models import db, Posts, POST_CARD_COLUMNS
+    from benchmarks.seed import seed_database
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        dataset = seed_database(users=args.users, posts=args.posts, seed=1234)
+
+    newest = (Posts.date_posted.desc(), Posts.id.desc())
+    results = {"dataset": dataset, "page_sizes": {}}
+    for size in args.page_sizes:
+        results["page_sizes"][size] = {
+            "orm_entities": measure(app, lambda: Posts.query.order_by(*newest).limit(size).all(), args.repeat),
+            "projected_rows": measure(app, lambda: Posts.query.with_entities(*POST_CARD_COLUMNS)
+                                      .order_by(*newest).limit(size).all(), args.repeat),
+        }
+
+    print(f"{'rows':>6}{'':2}{'orm ms':>10}{'rows ms':>10}{'orm KiB':>10}{'rows KiB':>10}{'tracked':>9}",
+          file=sys.stderr)
+    for size, r in results["page_sizes"].items():
+        orm, rows = r["orm_entities"], r["projected_rows"]
+        print(f"{size:>6}{'':2}{orm['median_ms']:>10}{rows['median_ms']:>10}{orm['peak_kib']:>10}"
+              f"{rows['peak_kib']:>10}{orm['identity_map']:>5}/{rows['identity_map']}", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""Query-plan regression check for every statement the routes issue.
+
+    python -m benchmarks.query_plans --posts 5000 --min-rows 1000
+    python -m benchmarks.query_plans --verbose      # print every plan
+    python -m benchmarks.query_plans --like-fallback --routes search
+
+Seeds a throwaway database, requests each route through the test client,
+captures the SQL it runs and replays each statement under EXPLAIN QUERY
+PLAN. Exits with status 1 when a statement scans a whole table, or sorts
+through a temporary B-tree, on a table holding at least --min-rows rows.
+Statements matching an --allow pattern (or ALLOWED below) are reported but
+never fail the run.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+
+from benchmarks.routes import route_cases
+
+# Relevance order comes from bm25() over the MATCH results, so no index can
+# serve it; the sort only ever sees the matching rows
+ALLOWED = [r"ORDER BY bm25\("]
+
+# Requested without a logged-in session
+ANONYMOUS = {"login", "signup"}
+
+# Extra routes worth covering besides the timed benchmark set; deletes run last
+def plan_cases(search_term):
+    cases = dict(route_cases(search_term))
+    cases.update({
+        "search_page_2": ("GET", f"/search?q={search_term}&page=2", {}),
+        "lesson_stats": ("GET", "/stats/lessons", {}),
+        "update_profile_form": ("GET", "/update_profile/{user_id}", {}),
+        "edit_post_form": ("GET", "/posts/edit/{own_post_id}", {}),
+        "add_post": ("POST", "/add-post", {"data": {"title": "plan", "content": "plan"}}),
+        "login": ("POST", "/login", {"data": {"email": "user1@example.com", "password": "benchmark"}}),
+        "signup": ("POST", "/signup", {"data": {"name": "Plan", "email": "plan@example.com", "password": "benchmark"}}),
+        "delete_post": ("GET", "/posts/delete/{own_post_id}", {}),
+    })
+    return cases
+
+TABLE_REF = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+"?(\w+)"?(?:\s+(?:AS\s+)?"?(\w+)"?)?', re.IGNORECASE)
+NOT_ALIASES = {"where", "join", "on", "order", "group", "limit", "inner", "left", "set", "values", "using",
+               "select", "natural", "cross", "returning", "default"}
+SCAN = re.compile(r"^SCAN (\w+)(.*)$")
+
+def table_aliases(statement):
+    aliases = {}
+    for table, alias in TABLE_REF.findall(statement):
+        aliases[table] = table
+        if alias and alias.lower() not in NOT_ALIASES:
+            aliases[alias] = table
+    return aliases
+
+class StatementLog:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH"):
+            self.statements.append((statement, parameters))
+
+def explain(connection, statement, parameters):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+# Full scans of a real table and temp B-tree sorts, on tables big enough to matter
+def problems(plan, statement, table_rows, min_rows):
+    aliases = table_aliases(statement)
+    touched = set()
+    found = []
+    for detail in plan:
+        words = detail.split()
+        if words[0] in ("SCAN", "SEARCH") and len(words) > 1:
+            touched.add(aliases.get(words[1], words[1]))
+        match = SCAN.match(detail)
+        if match and "VIRTUAL TABLE" not in match.group(2) and "USING" not in match.group(2):
+            table = aliases.get(match.group(1), match.group(1))
+            if table_rows.get(table, 0) >= min_rows:
+                found.append(f"full scan of {table} ({table_rows[table]} rows): {detail}")
+    for detail in plan:
+        if "USE TEMP B-TREE" in detail:
+            large = sorted(t for t in touched if table_rows.get(t, 0) >= min_rows)
+            if large:
+                found.append(f"temp B-tree sort over {', '.join(large)}: {detail}")
+    return found
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN every statement each route issues")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--min-rows", type=int, default=1000, help="ignore tables smaller than this")
+    parser.add_argument("--search-term", default="flask")
+    parser.add_argument("--routes", nargs="*", help="only check these routes")
+    parser.add_argument("--allow", nargs="*", default=[], help="extra regexes for statements allowed to fail")
+    parser.add_argument("--like-fallback", action="store_true", help="search with LIKE instead of FTS5")
+    parser.add_argument("--verbose", action="store_true", help="print every statement and plan")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="flaskify-plans-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'plans.db')}"
+    os.environ.setdefault("FORM_SECRET_KEY", "benchmark")
+
+    from sqlalchemy import event, inspect, text
+    from app import create_app
+    from models import db, Posts
+    from search_index import _fts_enabled
+    from pagination import encode_cursor
+    from benchmarks.seed import seed_database
+
+    app = create_app({"WTF_CSRF_ENABLED": False, "RATE_LIMIT_ENABLED": False, "ADMISSION_CONTROL_ENABLED": False,
+                      "PASSWORD_HASH_WORKERS": 0, "PROGRESS_FLUSH_DELAY": 0, "METRICS_ENABLED": False})
+    log = StatementLog()
+    with app.app_context():
+        db.create_all()
+        dataset = seed_database(users=args.users, posts=args.posts, seed=1234)
+        engine = db.engine
+        table_rows = {name: db.session.execute(text(f'SELECT count(*) FROM "{name}"')).scalar()
+                      for name in inspect(engine).get_table_names()}
+        middle = db.session.get(Posts, max(1, args.posts // 2))
+        cursor = encode_cursor(middle.date_posted, middle.id) if middle else ""
+        own_post = db.session.execute(db.select(Posts.id).where(Posts.user_id == 1).limit(1)).scalar() or 1
+        if args.like_fallback:
+            _fts_enabled[str(engine.url)] = False
+        for bound in db.engines.values():
+            event.listen(bound, "before_cursor_execute", log)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1"
+    allowed = [re.compile(pattern) for pattern in ALLOWED + args.allow]
+    params = dict(user_id=1, post_id=max(1, args.posts // 2), own_post_id=own_post, cursor=cursor)
+
+    results = {"dataset": dataset, "min_rows": args.min_rows, "routes": {}}
+    failures = 0
+    raw = engine.raw_connection()
+    try:
+        for name, (method, url, kwargs) in plan_cases(args.search_term).items():
+            if args.routes and name not in args.routes:
+                continue
+            log.statements = []
+            if isinstance(kwargs, list):
+                kwargs = kwargs[0]
+            response = (app.test_client() if name in ANONYMOUS else client).open(url.format(**params),
+                                                                                method=method, **kwargs)
+            # Streamed pages only query as the body is read
+            response.get_data()
+            checked = []
+            for statement, parameters in log.statements:
+                plan = explain(raw, statement, parameters)
+                found = problems(plan, statement, table_rows, args.min_rows)
+                allow = bool(found) and any(pattern.search(statement) for pattern in allowed)
+                if not allow:
+                    failures += len(found)
+                checked.append({"sql": " ".join(statement.split()), "plan": plan, "problems": found,
+                                "allowed": allow})
+                if args.verbose or found:
+                    print(f"[{name}] {' '.join(statement.split())[:160]}", file=sys.stderr)
+                    for detail in plan:
+                        print(f"    {detail}", file=sys.stderr)
+                    for problem in found:
+                        print(f"    {'allowed' if allow else 'PROBLEM'} {problem}", file=sys.stderr)
+            results["routes"][name] = checked
+    finally:
+        raw.close()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    elif args.verbose:
+        print(output)
+    statements = sum(len(checked) for checked in results["routes"].values())
+    print(f"{statements} statements over {len(results['routes'])} routes, {failures} problems", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""Concurrent burst against the rate limiter.
+
+    python -m benchmarks.rate_limit --processes 4 --threads 8 --capacity 50
+
+Every thread of every process hammers one bucket in a shared SQLite file
+(the RATE_LIMIT_BACKEND=sqlite setup), then a threaded burst goes through the
+app's /login route with the in-memory backend. Exits with status 1 if more
+(or fewer) requests got through than the bucket holds.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+def _burst(path, key, capacity, threads, attempts):
+    from rate_limit import SQLiteBackend
+    backend = SQLiteBackend(path)
+    # Refills one token a day, so only the initial capacity can get through
+    rate = 1 / 86400
+
+    def worker(_):
+        return sum(backend.take(key, capacity, rate)[0] for _ in range(attempts))
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return sum(executor.map(worker, range(threads)))
+
+def shared_burst(processes, threads, attempts, capacity):
+    path = os.path.join(tempfile.mkdtemp(prefix="flaskify-ratelimit-"), "rate_limits.db")
+    started = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        allowed = sum(pool.starmap(_burst, [(path, "burst", capacity, threads, attempts)] * processes))
+    elapsed = time.perf_counter() - started
+    total = processes * threads * attempts
+    return {"attempts": total, "allowed": allowed, "expected": min(capacity, total),
+            "takes_per_sec": round(total / elapsed, 1)}
+
+def app_burst(threads, attempts, capacity):
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='flaskify-ratelimit-'), 'app.db')}"
+    os.environ.setdefault("FORM_SECRET_KEY", "benchmark")
+    from app import create_app
+    from models import db
+
+    app = create_app({"WTF_CSRF_ENABLED": False, "PASSWORD_HASH_WORKERS": 0, "METRICS_ENABLED": False,
+                      "RATE_LIMITS": {"POST login": f"{capacity}/day"}})
+    with app.app_context():
+        db.create_all()
+
+    def worker(_):
+        client = app.test_client()
+        codes = [client.post("/login", data={"email": "nobody@example.com", "password": "x"}).status_code
+                 for _ in range(attempts)]
+        return codes.count(200), codes.count(429)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(worker, range(threads)))
+    total = threads * attempts
+    return {"attempts": total, "allowed": sum(ok for ok, _ in results),
+            "rejected": sum(limited for _, limited in results), "expected": min(capacity, total)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Burst the rate limiter from many threads and processes")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--attempts", type=int, default=25, help="attempts per thread")
+    parser.add_argument("--capacity", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    results = {
+        "sqlite_backend": shared_burst(args.processes, args.threads, args.attempts, args.capacity),
+        "login_route": app_burst(args.threads, args.attempts, args.capacity),
+    }
+    print(json.dumps(results, indent=2))
+    failures = [name for name, result in results.items() if result["allowed"] != result["expected"]]
+    for name in failures:
+        print(f"FAIL {name}: {results[name]['allowed']} allowed, expected {results[name]['expected']}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
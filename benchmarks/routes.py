@@ -0,0 +1,187 @@
+"""Route benchmarks against a seeded throwaway SQLite database.
+
+    python -m benchmarks.routes --users 200 --posts 5000 --output bench.json
+    python -m benchmarks.routes --baseline bench.json --threshold 0.2
+
+Exits with status 1 when any route's p95 latency or queries per request is
+worse than the baseline by more than the threshold.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+TOGGLED_LESSON = "lesson_one"
+
+# name -> (method, url, request kwargs); urls may use {user_id}, {post_id}, {cursor}.
+# A list of kwargs is cycled through request by request
+def route_cases(search_term):
+    return {
+        "index": ("GET", "/", {}),
+        "dashboard": ("GET", "/dashboard", {}),
+        "lesson": ("GET", "/dashboard/lesson_ten", {}),
+        "posts": ("GET", "/posts", {}),
+        "posts_deep_page": ("GET", "/posts?before={cursor}", {}),
+        "post": ("GET", "/posts/{post_id}", {}),
+        "profile": ("GET", "/profile", {}),
+        "search": ("GET", f"/search?q={search_term}", {}),
+        # Toggles one lesson so every request changes the stored progress;
+        # main() clears it for user 1 first
+        "save_progress": ("POST", "/save_progress", [{"json": {"added": [TOGGLED_LESSON], "removed": []}},
+                                                     {"json": {"added": [], "removed": [TOGGLED_LESSON]}}]),
+    }
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+# Reads the body chunk by chunk (streamed pages render and query as they are
+# read); returns (response, ms to the first chunk, ms to the whole body)
+def timed_request(client, method, url, kwargs):
+    t0 = time.perf_counter()
+    response = client.open(url, method=method, buffered=False, **kwargs)
+    chunks = iter(response.response)
+    next(chunks, None)
+    first_byte = (time.perf_counter() - t0) * 1000
+    for _ in chunks:
+        pass
+    response.close()
+    return response, first_byte, (time.perf_counter() - t0) * 1000
+
+def run_route(client, counter, method, url, kwargs, requests, warmup):
+    kwargs = itertools.cycle(kwargs if isinstance(kwargs, list) else [kwargs])
+    for _ in range(warmup):
+        timed_request(client, method, url, next(kwargs))
+
+    latencies, first_bytes, queries = [], [], []
+    started = time.perf_counter()
+    for _ in range(requests):
+        before = counter.count
+        response, first_byte, latency = timed_request(client, method, url, next(kwargs))
+        latencies.append(latency)
+        first_bytes.append(first_byte)
+        queries.append(counter.count - before)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {url} returned {response.status_code}")
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "first_byte_p50_ms": round(percentile(first_bytes, 50), 3),
+        "queries_per_request": round(sum(queries) / len(queries), 2),
+    }
+
+def compare(results, baseline, threshold):
+    failures = []
+    for name, result in results["routes"].items():
+        old = baseline.get("routes", {}).get(name)
+        if old is None:
+            continue
+        if result["p95_ms"] > old["p95_ms"] * (1 + threshold):
+            failures.append(f"{name}: p95 {old['p95_ms']}ms -> {result['p95_ms']}ms")
+        if result["queries_per_request"] > old["queries_per_request"]:
+            failures.append(f"{name}: queries/request {old['queries_per_request']} -> {result['queries_per_request']}")
+    return failures
+
+def print_table(results):
+    print(f"{'route':<18}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttfb ms':>10}{'queries':>9}",
+          file=sys.stderr)
+    for name, r in results["routes"].items():
+        print(f"{name:<18}{r['throughput_rps']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['first_byte_p50_ms']:>10}{r['queries_per_request']:>9}", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Flaskify routes")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--progress", type=float, default=0.8, help="share of users with lesson progress")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per route")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--routes", nargs="*", help="only run these routes")
+    parser.add_argument("--search-term", default="flask")
+    parser.add_argument("--per-page", type=int, help="posts and search results per page")
+    parser.add_argument("--no-stream", action="store_true", help="render the feed and search pages in one piece")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed p95 regression, 0.25 = 25%%")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="flaskify-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("FORM_SECRET_KEY", "benchmark")
+
+    from sqlalchemy import event
+    from app import create_app
+    from models import db, Posts, Users
+    from pagination import encode_cursor
+    from benchmarks.seed import seed_database
+
+    config = {"WTF_CSRF_ENABLED": False, "RATE_LIMIT_ENABLED": False, "STREAM_TEMPLATES": not args.no_stream}
+    if args.per_page:
+        config.update(POSTS_PER_PAGE=args.per_page, SEARCH_RESULTS_PER_PAGE=args.per_page)
+    app = create_app(config)
+    counter = QueryCounter()
+    with app.app_context():
+        db.create_all()
+        dataset = seed_database(users=args.users, posts=args.posts, progress=args.progress, seed=args.seed)
+        user = db.session.get(Users, 1)
+        user.progress = [lesson for lesson in user.progress if lesson != TOGGLED_LESSON]
+        db.session.commit()
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", counter)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1"
+
+    # A cursor halfway down the feed, to show deep pages cost the same as page one
+    with app.app_context():
+        middle = db.session.get(Posts, max(1, args.posts // 2))
+        cursor = encode_cursor(middle.date_posted, middle.id) if middle else ""
+    params = dict(user_id=1, post_id=max(1, args.posts // 2), cursor=cursor)
+
+    results = {"dataset": dataset, "requests_per_route": args.requests, "routes": {}}
+    for name, (method, url, kwargs) in route_cases(args.search_term).items():
+        if args.routes and name not in args.routes:
+            continue
+        results["routes"][name] = run_route(client, counter, method, url.format(**params), kwargs,
+                                            args.requests, args.warmup)
+
+    print_table(results)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f), args.threshold)
+        for failure in failures:
+            print(f"REGRESSION {failure}", file=sys.stderr)
+        if failures:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy import func, insert, select, update
+from werkzeug.security import generate_password_hash
+from models import db, Posts, Users
+from lesson_stats import backfill_completions
+
+BENCHMARK_PASSWORD = "benchmark"
+LESSON_IDS = sorted(path.stem for path in Path("templates/lessons").glob("*.html"))
+AVATARS = sorted(f"static/avatars/{path.name}" for path in Path("static/avatars").glob("*.png"))
+WORDS = ("flask route template jinja form database model query session login "
+         "blueprint request response json api cookie cache index migration test").split()
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+# <--- SYNTHETIC DATA --->
+# Bulk executemany inserts straight into the tables; every user shares one
+# password hash so seeding doesn't spend minutes in pbkdf2
+def seed_database(users=100, posts=1000, progress=0.8, seed=1234, chunk_size=1000):
+    rng = random.Random(seed)
+    password = generate_password_hash(BENCHMARK_PASSWORD, method="pbkdf2:sha256", salt_length=8)
+    start = datetime(2025, 1, 1)
+
+    user_rows = []
+    for n in range(1, users + 1):
+        done = rng.randint(0, len(LESSON_IDS)) if rng.random() < progress else 0
+        user_rows.append(dict(
+            id=n,
+            name=f"user{n}",
+            email=f"user{n}@example.com",
+            password=password,
+            date_added=start + timedelta(minutes=n),
+            bio=_sentence(rng, 8),
+            aspiring_job="Flaskify Enthusiast",
+            profile_picture=rng.choice(AVATARS),
+            progress=LESSON_IDS[:done],
+        ))
+    for chunk in _chunks(user_rows, chunk_size):
+        db.session.execute(insert(Users), chunk)
+        db.session.commit()
+
+    post_rows = []
+    for n in range(1, posts + 1):
+        author = rng.randint(1, users)
+        post_rows.append(dict(
+            id=n,
+            title=_sentence(rng, 3).title()[:30],
+            content=_sentence(rng, 25),
+            author=f"user{author}",
+            user_id=author,
+            date_posted=start + timedelta(seconds=n * 37),
+            profile_picture=user_rows[author - 1]["profile_picture"],
+        ))
+    for chunk in _chunks(post_rows, chunk_size):
+        db.session.execute(insert(Posts), chunk)
+        db.session.commit()
+
+    db.session.execute(update(Users).values(
+        post_count=select(func.count(Posts.id)).where(Posts.user_id == Users.id).scalar_subquery()))
+    db.session.commit()
+    backfill_completions()
+
+    return dict(users=users, posts=posts, lessons=len(LESSON_IDS))
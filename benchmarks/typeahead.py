@@ -0,0 +1,93 @@
+"""Navbar typeahead: in-memory prefix lookups against the equivalent SQL.
+
+    python -m benchmarks.typeahead --posts 50000 --prefixes f fl fla flask "flask ro" zzz
+
+Seeds a throwaway database, builds the prefix index and times lookups for
+each prefix, both through the index and with a LIKE word-prefix query over
+post titles and authors (what answering each keystroke from SQLite would
+cost). Also reports build time and index size. The seeded titles share a
+20-word vocabulary, so short prefixes match most posts: the worst case.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+LIKE_SUGGEST = """
+    SELECT id, title, author FROM posts
+    WHERE (' ' || lower(title) || ' ' || lower(author)) LIKE :pattern ESCAPE '\\'
+    ORDER BY id DESC LIMIT :limit
+"""
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def timed(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    return {"p50_us": round(percentile(timings, 0.5), 1), "p99_us": round(percentile(timings, 0.99), 1)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time typeahead lookups in memory and in SQL")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--posts", type=int, default=50000)
+    parser.add_argument("--prefixes", nargs="*", default=["f", "fl", "flask", "flask ro", "rout", "user1", "zzz"])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="flaskify-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("FORM_SECRET_KEY", "benchmark")
+
+    from sqlalchemy import text
+    from app import create_app
+    from models import db
+    from typeahead import typeahead_index, words
+    from benchmarks.seed import seed_database
+
+    app = create_app({"RATE_LIMIT_ENABLED": False})
+    with app.app_context():
+        db.create_all()
+        dataset = seed_database(users=args.users, posts=args.posts, seed=1234)
+        started = time.perf_counter()
+        typeahead_index.build()
+        build_ms = (time.perf_counter() - started) * 1000
+
+    results = {"dataset": dataset, "build_ms": round(build_ms, 1), "index": typeahead_index.stats(), "prefixes": {}}
+    limit = typeahead_index.limit
+    with app.app_context():
+        for prefix in args.prefixes:
+            # Only the longest word is matched in SQL; close enough for timing
+            pattern = "% " + max(words(prefix) or [""], key=len).replace("%", "\\%").replace("_", "\\_") + "%"
+            statement = text(LIKE_SUGGEST).bindparams(pattern=pattern, limit=limit)
+            results["prefixes"][prefix] = {
+                "matches": len(typeahead_index.lookup(prefix)),
+                "index": timed(lambda: typeahead_index.lookup(prefix), args.repeat),
+                "sql_like": timed(lambda: db.session.execute(statement).all(), max(1, args.repeat // 10)),
+            }
+
+    print(f"index of {results['index']['entries']} entries / {results['index']['words']} words "
+          f"built in {results['build_ms']} ms", file=sys.stderr)
+    print(f"{'prefix':<12}{'found':>6}{'index p50 us':>14}{'p99 us':>10}{'sql p50 us':>13}{'p99 us':>10}",
+          file=sys.stderr)
+    for prefix, r in results["prefixes"].items():
+        print(f"{prefix:<12}{r['matches']:>6}{r['index']['p50_us']:>14}{r['index']['p99_us']:>10}"
+              f"{r['sql_like']['p50_us']:>13}{r['sql_like']['p99_us']:>10}", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import hmac
+import json
+import time
+from datetime import datetime
+import click
+from flask import abort, current_app, request
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from models import db, Posts, Users
+from database import read_only
+from lesson_stats import backfill_completions
+from streaming import stream_response
+
+# One JSON object per line, tagged with "type"; files list every user, then
+# every post, then every user's progress, so an import can insert in order
+RECORD_TYPES = ("user", "post", "progress")
+USER_FIELDS = ("id", "name", "email", "date_added", "bio", "profile_picture", "aspiring_job")
+POST_FIELDS = ("id", "title", "content", "author", "date_posted", "user_id", "profile_picture", "version")
+DATE_FIELDS = {"date_added", "date_posted"}
+
+# Stored for imported users that came without a hash; it never verifies, so
+# those accounts can't be logged into until their password is set again
+UNUSABLE_PASSWORD = "!"
+
+CONFLICT_MODES = ("error", "skip", "update")
+
+class BulkDataError(ValueError):
+    pass
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+# <--- EXPORT --->
+# Columns only (no ORM objects) fetched `batch_size` rows at a time, so memory
+# stays flat however big the tables are. All record types are read in the
+# session's one transaction, so the file is a consistent snapshot.
+def _export_query(record_type, with_passwords):
+    if record_type == "user":
+        columns = [getattr(Users, field) for field in USER_FIELDS]
+        if with_passwords:
+            columns.append(Users.password)
+        return select(*columns).order_by(Users.id)
+    if record_type == "post":
+        return select(*(getattr(Posts, field) for field in POST_FIELDS)).order_by(Posts.id)
+    return select(Users.id.label("user_id"), Users.progress.label("lessons")).order_by(Users.id)
+
+def export_lines(types=RECORD_TYPES, batch_size=1000, with_passwords=False, counts=None):
+    counts = {} if counts is None else counts
+    for record_type in RECORD_TYPES:
+        if record_type not in types:
+            continue
+        counts[record_type] = 0
+        result = db.session.execute(_export_query(record_type, with_passwords),
+                                    execution_options={"yield_per": batch_size})
+        for row in result:
+            record = {"type": record_type, **row._mapping}
+            if record_type == "progress" and not record["lessons"]:
+                continue
+            counts[record_type] += 1
+            yield json.dumps(record, default=_json_default, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+# Lines joined into writes of about `size` characters
+def _joined(lines, size=65536):
+    buffered, length = [], 0
+    for line in lines:
+        buffered.append(line)
+        length += len(line)
+        if length >= size:
+            yield "".join(buffered)
+            buffered, length = [], 0
+    if buffered:
+        yield "".join(buffered)
+
+# <--- IMPORT --->
+def _parse_row(record_type, record, number):
+    try:
+        if record_type == "progress":
+            lessons = record["lessons"]
+            if not isinstance(lessons, list) or not all(isinstance(lesson, str) for lesson in lessons):
+                raise ValueError("lessons must be a list of lesson ids")
+            return {"user_id": int(record["user_id"]), "lessons": lessons}
+
+        fields = USER_FIELDS if record_type == "user" else POST_FIELDS
+        row = {field: record[field] for field in fields if field in record}
+        row["id"] = int(record["id"])
+        for field in DATE_FIELDS & row.keys():
+            if row[field] is not None:
+                row[field] = datetime.fromisoformat(row[field])
+        if record_type == "user":
+            if not row.get("name") or not row.get("email"):
+                raise ValueError("users need a name and an email")
+            if record.get("password"):
+                row["password"] = record["password"]
+        return row
+    except (KeyError, TypeError, ValueError) as e:
+        raise BulkDataError(f"line {number}: bad {record_type} record ({e})") from None
+
+def _insert(table, rows, on_conflict, keep_on_update=()):
+    if on_conflict == "error":
+        return insert(table)
+    stmt = sqlite_insert(table)
+    if on_conflict == "skip":
+        return stmt.on_conflict_do_nothing(index_elements=[table.c.id])
+    set_ = {column: stmt.excluded[column] for column in rows[0] if column != "id" and column not in keep_on_update}
+    if "version" in table.c:
+        # Rendered post cards are cached by version
+        set_["version"] = table.c.version + 1
+    return stmt.on_conflict_do_update(index_elements=[table.c.id], set_=set_)
+
+def _write(record_type, rows, on_conflict):
+    if record_type == "progress":
+        users = Users.__table__
+        db.session.execute(
+            update(users)
+            .where(users.c.id == bindparam("user_id"))
+            .values(progress=bindparam("lessons", type_=users.c.progress.type)),
+            rows)
+        return
+
+    # executemany needs the same keys on every row, so rows are grouped by the
+    # fields they carry. Users without a hash get the unusable one on insert
+    # and keep their current one on update.
+    table = Users.__table__ if record_type == "user" else Posts.__table__
+    groups = {}
+    for row in rows:
+        keep = ()
+        if record_type == "user" and "password" not in row:
+            row, keep = dict(row, password=UNUSABLE_PASSWORD), ("password",)
+        groups.setdefault((tuple(row), keep), []).append(row)
+    for (_, keep), group in groups.items():
+        db.session.execute(_insert(table, group, on_conflict, keep_on_update=keep), group)
+
+# Core executemany inserts, committed every `batch_size` rows; post counts and
+# the lesson completion tables are rebuilt once at the end. Returns
+# ({record type: rows}, seconds).
+def import_lines(lines, batch_size=1000, on_conflict="error"):
+    if on_conflict not in CONFLICT_MODES:
+        raise BulkDataError(f"on_conflict must be one of {', '.join(CONFLICT_MODES)}")
+    started = time.perf_counter()
+    counts = dict.fromkeys(RECORD_TYPES, 0)
+    pending = {record_type: [] for record_type in RECORD_TYPES}
+
+    # Users go in before the posts and progress that point at them
+    def flush():
+        for record_type in RECORD_TYPES:
+            if pending[record_type]:
+                _write(record_type, pending[record_type], on_conflict)
+                counts[record_type] += len(pending[record_type])
+                pending[record_type] = []
+        db.session.commit()
+
+    try:
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise BulkDataError(f"line {number}: not valid JSON") from None
+            record_type = record.get("type") if isinstance(record, dict) else None
+            if record_type not in RECORD_TYPES:
+                raise BulkDataError(f"line {number}: unknown record type {record_type!r}")
+            pending[record_type].append(_parse_row(record_type, record, number))
+            if len(pending[record_type]) >= batch_size:
+                flush()
+        flush()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if counts["post"] or counts["user"]:
+        db.session.execute(update(Users).values(
+            post_count=select(func.count(Posts.id)).where(Posts.user_id == Users.id).scalar_subquery()))
+        db.session.commit()
+    if counts["user"] or counts["progress"]:
+        backfill_completions()
+    return counts, time.perf_counter() - started
+
+def _summary(counts, seconds):
+    total = sum(counts.values())
+    parts = ", ".join(f"{count} {record_type}" for record_type, count in counts.items())
+    return f"{parts} in {seconds:.2f}s ({total / seconds if seconds else 0:.0f} rows/s)"
+
+# <--- ADMIN EXPORT ENDPOINT --->
+# GET /admin/export[?types=user,post,progress] with
+# "Authorization: Bearer <EXPORT_TOKEN>"; unset EXPORT_TOKEN turns it off.
+# Password hashes are never included here.
+@read_only
+def export_view():
+    token = current_app.config.get('EXPORT_TOKEN')
+    if not token:
+        abort(404)
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+        abort(401)
+    types = request.args.get("types")
+    types = tuple(types.split(",")) if types else RECORD_TYPES
+    if not set(types) <= set(RECORD_TYPES):
+        abort(400)
+
+    filename = f"flaskify-{datetime.now().strftime('%Y%m%d-%H%M%S')}.ndjson"
+    response = stream_response(_joined(export_lines(types)), mimetype="application/x-ndjson")
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+def init_bulk_data(app):
+    app.add_url_rule('/admin/export', 'export_data', export_view)
+    app.cli.add_command(export_data_command)
+    app.cli.add_command(import_data_command)
+
+# <--- CLI --->
+@click.command("export-data")
+@click.option("--output", "-o", type=click.File("w", encoding="utf-8"), default="-", help="File to write (default: stdout)")
+@click.option("--type", "types", multiple=True, type=click.Choice(RECORD_TYPES), help="Only these record types (repeatable)")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows fetched per round trip")
+@click.option("--with-password-hashes", is_flag=True, help="Include users' password hashes (keep the file private)")
+def export_data_command(output, types, batch_size, with_password_hashes):
+    """Write users, posts and progress as NDJSON."""
+    started = time.perf_counter()
+    counts = {}
+    for chunk in _joined(export_lines(types or RECORD_TYPES, batch_size, with_password_hashes, counts)):
+        output.write(chunk)
+    output.flush()
+    click.echo(f"Exported {_summary(counts, time.perf_counter() - started)}", err=True)
+
+@click.command("import-data")
+@click.argument("input", type=click.File("r", encoding="utf-8"), default="-")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows per executemany and per transaction")
+@click.option("--on-conflict", type=click.Choice(CONFLICT_MODES), default="error", show_default=True,
+              help="What to do with ids that already exist")
+def import_data_command(input, batch_size, on_conflict):
+    """Load an NDJSON file written by export-data."""
+    try:
+        counts, seconds = import_lines(input, batch_size, on_conflict)
+    except (BulkDataError, IntegrityError) as e:
+        message = e.orig if isinstance(e, IntegrityError) else e
+        raise click.ClickException(f"{message}; batches before it were committed")
+    click.echo(f"Imported {_summary(counts, seconds)}")
@@ -0,0 +1,183 @@
+import os
+
+def env_int(name, default):
+    return int(os.getenv(name, default))
+
+def env_float(name, default):
+    return float(os.getenv(name, default))
+
+def env_bool(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# <--- APP CONFIG --->
+# Everything comes from the environment (or .env); see README for the list
+class Config:
+    # Secret key - NEEDS TO BE CHANGED FOR SECURITY REASONS
+    SECRET_KEY = os.getenv("FORM_SECRET_KEY")
+
+    # Database
+    SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///users.db")
+
+    # Pragmas run on every new SQLite connection
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_CACHE_SIZE = env_int("SQLITE_CACHE_SIZE", -16000)      # negative = KiB
+    SQLITE_MMAP_SIZE = env_int("SQLITE_MMAP_SIZE", 128 * 1024 * 1024)
+    SQLITE_BUSY_TIMEOUT = env_int("SQLITE_BUSY_TIMEOUT", 5000)     # milliseconds
+
+    # Connection pool, per worker process (turned into SQLALCHEMY_ENGINE_OPTIONS
+    # by database.engine_config)
+    DB_POOL_SIZE = env_int("DB_POOL_SIZE", 5)
+    DB_MAX_OVERFLOW = env_int("DB_MAX_OVERFLOW", 5)
+    DB_POOL_TIMEOUT = env_float("DB_POOL_TIMEOUT", 10)
+    DB_POOL_RECYCLE = env_int("DB_POOL_RECYCLE", 3600)
+
+    # Optional second pool for views marked @read_only (query_only connections)
+    DATABASE_READ_SPLIT = env_bool("DATABASE_READ_SPLIT")
+    DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")    # default: the main database
+    DB_READ_POOL_SIZE = env_int("DB_READ_POOL_SIZE", 10)
+
+    # Posts each user may have at once
+    MAX_POSTS_PER_USER = env_int("MAX_POSTS_PER_USER", 5)
+
+    # Pages
+    POSTS_PER_PAGE = env_int("POSTS_PER_PAGE", 10)
+    SEARCH_RESULTS_PER_PAGE = env_int("SEARCH_RESULTS_PER_PAGE", 10)
+
+    # Seconds to hold lesson progress changes before writing them (0 = write immediately)
+    PROGRESS_FLUSH_DELAY = env_float("PROGRESS_FLUSH_DELAY", 2)
+
+    # Logged-in users are served from an in-process cache (size 0 disables it)
+    USER_CACHE_SIZE = env_int("USER_CACHE_SIZE", 1024)
+    USER_CACHE_TTL = env_float("USER_CACHE_TTL", 60)
+
+    # Browser/proxy cache lifetime for pre-rendered lesson pages, in seconds
+    LESSON_CACHE_MAX_AGE = env_int("LESSON_CACHE_MAX_AGE", 300)
+
+    # Rendered post cards kept per worker (0 disables the cache)
+    FRAGMENT_CACHE_SIZE = env_int("FRAGMENT_CACHE_SIZE", 2048)
+
+    # Admission control: each group of expensive endpoints runs at most
+    # `concurrency` requests at once per worker, with up to `queue` more waiting
+    # `timeout` seconds for a slot; the rest get a 503. Other endpoints are
+    # never held back.
+    ADMISSION_CONTROL_ENABLED = env_bool("ADMISSION_CONTROL_ENABLED", True)
+    ADMISSION_RETRY_AFTER = env_int("ADMISSION_RETRY_AFTER", 1)
+    ADMISSION_GROUPS = {
+        "auth": {
+            "endpoints": ["login", "signup"],
+            "concurrency": env_int("ADMISSION_AUTH_CONCURRENCY", 4),
+            "queue": env_int("ADMISSION_AUTH_QUEUE", 8),
+            "timeout": env_float("ADMISSION_QUEUE_TIMEOUT", 1),
+        },
+        "search": {
+            "endpoints": ["search"],
+            "concurrency": env_int("ADMISSION_SEARCH_CONCURRENCY", 4),
+            "queue": env_int("ADMISSION_SEARCH_QUEUE", 8),
+            "timeout": env_float("ADMISSION_QUEUE_TIMEOUT", 1),
+        },
+        "writes": {
+            "endpoints": ["save_progress", "add_post", "edit_post", "delete_post", "update"],
+            "concurrency": env_int("ADMISSION_WRITES_CONCURRENCY", 8),
+            "queue": env_int("ADMISSION_WRITES_QUEUE", 16),
+            "timeout": env_float("ADMISSION_QUEUE_TIMEOUT", 1),
+        },
+    }
+
+    # Token-bucket rate limits per route and client ("<count>/<second|minute|
+    # hour|day>", optional method prefix). The "sqlite" backend keeps buckets in
+    # RATE_LIMIT_DB (default instance/rate_limits.db) so all workers share them.
+    # Anonymous clients are keyed by address; behind a reverse proxy set
+    # PROXY_FIX_X_FOR to the number of proxies that append to X-Forwarded-For
+    PROXY_FIX_X_FOR = env_int("PROXY_FIX_X_FOR", 0)
+    RATE_LIMIT_ENABLED = env_bool("RATE_LIMIT_ENABLED", True)
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB")
+    RATE_LIMITS = {
+        "POST login": os.getenv("RATE_LIMIT_LOGIN", "10/minute"),
+        "POST signup": os.getenv("RATE_LIMIT_SIGNUP", "5/minute"),
+        "search": os.getenv("RATE_LIMIT_SEARCH", "30/minute"),
+        "POST save_progress": os.getenv("RATE_LIMIT_SAVE_PROGRESS", "120/minute"),
+        "search_suggest": os.getenv("RATE_LIMIT_SEARCH_SUGGEST", "300/minute"),
+    }
+
+    # Password hashing: werkzeug method string (cost included, e.g.
+    # "pbkdf2:sha256:600000" or "scrypt:32768:8:1"); older hashes are upgraded
+    # at login. Hashes run in PASSWORD_HASH_WORKERS processes (0 = on the
+    # request thread) with at most PASSWORD_HASH_QUEUE waiting per worker.
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256")
+    PASSWORD_SALT_LENGTH = env_int("PASSWORD_SALT_LENGTH", 16)
+    PASSWORD_HASH_WORKERS = env_int("PASSWORD_HASH_WORKERS", 2)
+    PASSWORD_HASH_QUEUE = env_int("PASSWORD_HASH_QUEUE", 8)
+    PASSWORD_HASH_TIMEOUT = env_float("PASSWORD_HASH_TIMEOUT", 10)
+
+    # Build resized WebP/PNG avatar variants at startup when Pillow is installed
+    AVATAR_BUILD_VARIANTS = env_bool("AVATAR_BUILD_VARIANTS", True)
+
+    # Write gzip/brotli copies of static files at startup (default directory:
+    # instance/static_build)
+    STATIC_PRECOMPRESS = env_bool("STATIC_PRECOMPRESS", True)
+    STATIC_BUILD_DIR = os.getenv("STATIC_BUILD_DIR")
+
+    # Send the feed and search pages while they render, head and nav first,
+    # then in chunks of about STREAM_CHUNK_SIZE characters
+    STREAM_TEMPLATES = env_bool("STREAM_TEMPLATES", True)
+    STREAM_CHUNK_SIZE = env_int("STREAM_CHUNK_SIZE", 8192)
+
+    # Server-Sent Events at /posts/live that patch open feed pages. Each stream
+    # holds a server thread, so it is off unless the workers are threaded
+    # (gthread); at most LIVE_FEED_MAX_CONNECTIONS per worker,
+    # each closed after LIVE_FEED_MAX_AGE seconds (the browser reconnects). The
+    # "sqlite" backend relays changes through LIVE_FEED_DB (default
+    # instance/live_feed.db), polled every LIVE_FEED_POLL_INTERVAL seconds, so
+    # every worker sees every post.
+    LIVE_FEED_ENABLED = env_bool("LIVE_FEED_ENABLED")
+    LIVE_FEED_BACKEND = os.getenv("LIVE_FEED_BACKEND", "memory")
+    LIVE_FEED_DB = os.getenv("LIVE_FEED_DB")
+    LIVE_FEED_POLL_INTERVAL = env_float("LIVE_FEED_POLL_INTERVAL", 0.5)
+    LIVE_FEED_MAX_CONNECTIONS = env_int("LIVE_FEED_MAX_CONNECTIONS", 100)
+    LIVE_FEED_HEARTBEAT = env_float("LIVE_FEED_HEARTBEAT", 15)
+    LIVE_FEED_MAX_AGE = env_float("LIVE_FEED_MAX_AGE", 300)
+
+    # Navbar search suggestions, served from an in-memory prefix index that is
+    # rebuilt every TYPEAHEAD_REBUILD_INTERVAL seconds (0 = never) to pick up
+    # posts written through other workers
+    TYPEAHEAD_RESULTS = env_int("TYPEAHEAD_RESULTS", 8)
+    TYPEAHEAD_REBUILD_INTERVAL = env_float("TYPEAHEAD_REBUILD_INTERVAL", 300)
+
+    # Compiled templates cached on disk (default: instance/jinja_cache) and
+    # optionally all loaded at startup
+    JINJA_BYTECODE_CACHE = env_bool("JINJA_BYTECODE_CACHE", True)
+    JINJA_BYTECODE_CACHE_DIR = os.getenv("JINJA_BYTECODE_CACHE_DIR")
+    TEMPLATE_WARMUP = env_bool("TEMPLATE_WARMUP")
+
+    # Prometheus metrics at /metrics, served only with METRICS_TOKEN set (or in
+    # debug mode); set METRICS_DIR to a directory shared by all workers so each
+    # scrape sums every process
+    METRICS_ENABLED = env_bool("METRICS_ENABLED", True)
+    METRICS_DIR = os.getenv("METRICS_DIR")
+    METRICS_WRITE_INTERVAL = env_float("METRICS_WRITE_INTERVAL", 1)
+    METRICS_STALE_AFTER = env_float("METRICS_STALE_AFTER", 300)
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+    # On-demand request profiling: when enabled, requests sent with
+    # "X-Profile: <PROFILER_TOKEN>" plus a random PROFILER_SAMPLE_RATE share are
+    # written as folded call stacks to PROFILER_DIR (default instance/profiles).
+    # `flask profiler on|off` overrides these at runtime through
+    # PROFILER_CONTROL_FILE (default instance/profiler.json).
+    PROFILER_ENABLED = env_bool("PROFILER_ENABLED")
+    PROFILER_SAMPLE_RATE = env_float("PROFILER_SAMPLE_RATE", 0)
+    PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+    PROFILER_DIR = os.getenv("PROFILER_DIR")
+    PROFILER_KEEP = env_int("PROFILER_KEEP", 200)
+    PROFILER_CONTROL_FILE = os.getenv("PROFILER_CONTROL_FILE")
+
+    # Bearer token for GET /admin/export (NDJSON dump of users, posts and
+    # progress, without password hashes); unset, the endpoint answers 404
+    EXPORT_TOKEN = os.getenv("EXPORT_TOKEN")
+
+    # Log how long each create_app() step took
+    STARTUP_PROFILE = env_bool("STARTUP_PROFILE")
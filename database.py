@@ -0,0 +1,87 @@
+from functools import wraps
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+READ_ONLY_BIND = "readonly"
+
+# <--- READ/WRITE ROUTING --->
+# Inside a @read_only view, queries go to the "readonly" pool when one is
+# configured and the session never autoflushes; flushes (and everything outside
+# those views) use the primary pool
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get("db_read_only"):
+            engine = self._db.engines.get(READ_ONLY_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def read_only(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        with current_app.extensions['sqlalchemy'].session.no_autoflush:
+            return view(*args, **kwargs)
+    return wrapper
+
+# <--- ENGINE OPTIONS --->
+def is_sqlite_file(uri):
+    return uri.startswith("sqlite:///") and ":memory:" not in uri and "mode=memory" not in uri
+
+# Pool settings only apply to file databases; in-memory SQLite uses a
+# single-connection pool that rejects them
+def engine_options(uri, config, pool_size):
+    options = {
+        "connect_args": {
+            "timeout": config['SQLITE_BUSY_TIMEOUT'] / 1000,
+            "check_same_thread": False,
+        },
+    }
+    if is_sqlite_file(uri):
+        options.update(
+            pool_size=pool_size,
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+        )
+    return options
+
+# Fill in Flask-SQLAlchemy's engine settings from the DB_* / DATABASE_* config,
+# unless they were given explicitly
+def engine_config(config):
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(uri, config, config['DB_POOL_SIZE']))
+    if config.get('DATABASE_READ_SPLIT') and 'SQLALCHEMY_BINDS' not in config:
+        read_uri = config.get('DATABASE_READ_URL') or uri
+        config['SQLALCHEMY_BINDS'] = {
+            READ_ONLY_BIND: {"url": read_uri, **engine_options(read_uri, config, config['DB_READ_POOL_SIZE'])},
+        }
+
+# <--- SQLITE PRAGMAS --->
+def sqlite_pragmas(config, query_only=False):
+    pragmas = [
+        f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA cache_size = {int(config['SQLITE_CACHE_SIZE'])}",
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT'])}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if query_only:
+        pragmas.append("PRAGMA query_only = ON")
+    return pragmas
+
+def configure_engines(app, db):
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != "sqlite":
+                continue
+            pragmas = sqlite_pragmas(app.config, query_only=key == READ_ONLY_BIND)
+
+            @event.listens_for(engine, "connect")
+            def set_pragmas(dbapi_connection, connection_record, pragmas=pragmas):
+                cursor = dbapi_connection.cursor()
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+                cursor.close()
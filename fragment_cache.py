@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+from flask import render_template
+from flask_login import current_user
+from markupsafe import Markup
+
+# Wrapped around the owner-only controls in a card template, then split out
+OWNER_START = "\x00owner\x00"
+OWNER_END = "\x00/owner\x00"
+
+# <--- POST CARD FRAGMENT CACHE --->
+# Rendered post cards keyed on (template, post id, post version, date posted).
+# A card is stored as (before, owner controls, after) so the only per-viewer
+# work is choosing whether to include the middle piece. Editing a post bumps
+# its version, and SQLite hands a deleted post's id to the next post (which
+# starts again at version 1) but not its date, so a worker that never saw the
+# edit or delete misses instead of serving the old card. edit_post/delete_post
+# also evict the post here to free the memory straight away.
+class FragmentCache:
+    def __init__(self, app=None):
+        self.max_size = 2048
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys_by_post = {}
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_size = app.config.get('FRAGMENT_CACHE_SIZE', self.max_size)
+        app.add_template_global(self.post_card, "post_card")
+        app.extensions['fragment_cache'] = self
+
+    def _store(self, key, parts):
+        with self._lock:
+            self._entries[key] = parts
+            self._keys_by_post.setdefault(key[1], set()).add(key)
+            while len(self._entries) > self.max_size:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+
+    def _forget(self, key):
+        keys = self._keys_by_post.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_post[key[1]]
+
+    def invalidate_post(self, post_id):
+        with self._lock:
+            for key in self._keys_by_post.pop(post_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_post.clear()
+
+    def post_card(self, template, post):
+        key = (template, post.id, post.version, post.date_posted)
+        with self._lock:
+            parts = self._entries.get(key)
+            if parts is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if parts is None:
+            html = render_template(template, post=post,
+                                   owner_controls_start=OWNER_START,
+                                   owner_controls_end=OWNER_END)
+            before, rest = html.split(OWNER_START, 1)
+            owner, after = rest.split(OWNER_END, 1)
+            parts = (before, owner, after)
+            if self.max_size > 0:
+                self._store(key, parts)
+
+        before, owner, after = parts
+        is_owner = current_user.is_authenticated and post.user_id == current_user.id
+        return Markup(before + owner + after if is_owner else before + after)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size,
+                    "hits": self.hits, "misses": self.misses}
+
+fragment_cache = FragmentCache()
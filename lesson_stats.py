@@ -0,0 +1,108 @@
+import click
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Users, LessonCompletion, LessonStats
+from valid_url import COURSE_ORDER
+
+ALL_USERS = "*"
+
+def _bump(deltas):
+    deltas = {lesson: delta for lesson, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    stmt = sqlite_insert(LessonStats).values(
+        [{"lesson_id": lesson, "completions": delta} for lesson, delta in deltas.items()])
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[LessonStats.lesson_id],
+        set_={"completions": LessonStats.completions + stmt.excluded.completions}))
+
+# <--- LESSON COMPLETION SYNC --->
+# Called with a user's progress before and after a change, inside the same
+# transaction as the Users.progress write. Completion rows are inserted and
+# deleted with RETURNING, so the counters move only for rows that really
+# changed and stay equal to the row counts even if a change is replayed.
+def record_progress_change(user_id, old, new):
+    old, new = set(old or ()), set(new or ())
+    added, removed = new - old, old - new
+    deltas = {}
+    if added:
+        inserted = db.session.execute(
+            sqlite_insert(LessonCompletion)
+            .values([{"user_id": user_id, "lesson_id": lesson} for lesson in added])
+            .on_conflict_do_nothing()
+            .returning(LessonCompletion.lesson_id)
+        ).scalars().all()
+        for lesson in inserted:
+            deltas[lesson] = deltas.get(lesson, 0) + 1
+    if removed:
+        deleted = db.session.execute(
+            delete(LessonCompletion)
+            .where(LessonCompletion.user_id == user_id, LessonCompletion.lesson_id.in_(removed))
+            .returning(LessonCompletion.lesson_id)
+        ).scalars().all()
+        for lesson in deleted:
+            deltas[lesson] = deltas.get(lesson, 0) - 1
+    _bump(deltas)
+
+def record_new_user():
+    _bump({ALL_USERS: 1})
+
+# <--- COMPLETION STATS --->
+# Reads one row per lesson, however many users there are
+def completion_stats():
+    counts = dict(db.session.execute(select(LessonStats.lesson_id, LessonStats.completions)).all())
+    users = counts.get(ALL_USERS, 0)
+    lessons = []
+    previous = users
+    for lesson in COURSE_ORDER:
+        completions = counts.get(lesson, 0)
+        lessons.append({
+            "lesson": lesson,
+            "completions": completions,
+            "percent": round(100 * completions / users, 1) if users else 0.0,
+            # Share of those who finished the previous lesson (or of all users
+            # for the first one)
+            "funnel_percent": round(100 * completions / previous, 1) if previous else 0.0,
+        })
+        previous = completions
+    return {"users": users, "lessons": lessons}
+
+# <--- BACKFILL --->
+# Rebuilds both tables from Users.progress, reading users in batches
+def backfill_completions(batch_size=1000):
+    db.session.execute(delete(LessonCompletion))
+    db.session.execute(delete(LessonStats))
+    valid = set(COURSE_ORDER)
+
+    users = 0
+    rows = []
+    last_id = 0
+    while True:
+        batch = db.session.execute(
+            select(Users.id, Users.progress).where(Users.id > last_id).order_by(Users.id).limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        for user_id, progress in batch:
+            users += 1
+            rows += [{"user_id": user_id, "lesson_id": lesson}
+                     for lesson in dict.fromkeys(progress or ()) if lesson in valid]
+        last_id = batch[-1][0]
+        if rows:
+            db.session.execute(insert(LessonCompletion), rows)
+            rows = []
+
+    totals = db.session.execute(
+        select(LessonCompletion.lesson_id, func.count()).group_by(LessonCompletion.lesson_id)).all()
+    stats = [{"lesson_id": lesson, "completions": count} for lesson, count in totals]
+    stats.append({"lesson_id": ALL_USERS, "completions": users})
+    db.session.execute(insert(LessonStats), stats)
+    db.session.commit()
+    return users, sum(count for _, count in totals)
+
+@click.command("backfill-lesson-stats")
+@click.option("--batch-size", default=1000, show_default=True, help="Users read per query")
+def backfill_lesson_stats_command(batch_size):
+    """Rebuild lesson_completions and lesson_stats from users' progress."""
+    users, completions = backfill_completions(batch_size)
+    click.echo(f"Backfilled {completions} completions for {users} users")
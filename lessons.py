@@ -0,0 +1,64 @@
+import hashlib
+import threading
+from flask import make_response, render_template, request, session
+from valid_url import LESSONS
+
+# <--- PRE-RENDERED LESSONS --->
+# Lesson pages are the same for every visitor, so each one is rendered once and
+# served from memory with a strong ETag; a revalidating browser gets a 304 and
+# nothing is rendered. Pages with pending flash messages are rendered normally
+# because those messages belong to one user.
+class LessonPages:
+    def __init__(self, app=None):
+        self.app = None
+        self.max_age = 300
+        self._lock = threading.Lock()
+        self._pages = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_age = app.config.get('LESSON_CACHE_MAX_AGE', self.max_age)
+        app.extensions['lesson_pages'] = self
+
+    @staticmethod
+    def _render(lesson):
+        return render_template(f"/lessons/{lesson}.html").encode("utf-8")
+
+    def get(self, lesson):
+        page = self._pages.get(lesson)
+        if page is None:
+            body = self._render(lesson)
+            page = (body, hashlib.sha256(body).hexdigest()[:32])
+            with self._lock:
+                self._pages[lesson] = page
+        return page
+
+    # Render every lesson up front, e.g. right after the app is created
+    def prerender(self):
+        with self.app.test_request_context("/"):
+            for lesson in sorted(LESSONS):
+                self.get(lesson)
+        return len(self._pages)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def response(self, lesson):
+        if session.get("_flashes"):
+            return render_template(f"/lessons/{lesson}.html")
+
+        # Templates may change under the dev server's auto-reload
+        if self.app.debug or self.app.config.get("TEMPLATES_AUTO_RELOAD"):
+            self.clear()
+
+        body, etag = self.get(lesson)
+        response = make_response(body)
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        return response.make_conditional(request)
+
+lesson_pages = LessonPages()
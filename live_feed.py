@@ -0,0 +1,262 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+from flask import current_app, request
+from flask_login import login_required
+from werkzeug.exceptions import ServiceUnavailable
+from models import POST_CARD_COLUMNS
+from fragment_cache import fragment_cache
+from streaming import stream_response
+
+FEED_CARD = "components/post_card_feed.html"
+
+# What a feed card needs, rebuilt from an event without touching the database
+PostCard = namedtuple("PostCard", [column.key for column in POST_CARD_COLUMNS])
+
+def post_data(post):
+    data = {field: getattr(post, field) for field in PostCard._fields}
+    data["date_posted"] = data["date_posted"].isoformat() if data["date_posted"] else None
+    return data
+
+def _post_card(data):
+    if data is None:
+        return None
+    data = dict(data)
+    if data["date_posted"]:
+        data["date_posted"] = datetime.fromisoformat(data["date_posted"])
+    return PostCard(**data)
+
+# <--- FEED HUB --->
+# Per worker. Events are kept in one short history numbered by `seq`, and every
+# open stream waits on the same condition for numbers past the last one it
+# sent, so publishing is an append and a notify however many clients listen.
+# A stream resuming from a number the history no longer reaches (or from a
+# number this worker never gave out) is told to reload instead.
+class FeedHub:
+    def __init__(self, history=256):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._floor = 0
+        self.last = 0
+        self.connections = 0
+        self.published = 0
+        self.rejected = 0
+
+    def reset(self, seq):
+        with self._condition:
+            self._events.clear()
+            self._floor = self.last = seq
+
+    def publish(self, action, post_id, data, seq=None):
+        post = _post_card(data)
+        with self._condition:
+            event = (self.last + 1 if seq is None else seq, action, post_id, post)
+            if len(self._events) == self._events.maxlen:
+                self._floor = self._events[0][0]
+            self._events.append(event)
+            self.last = event[0]
+            self.published += 1
+            self._condition.notify_all()
+
+    # ([(seq, action, post id, PostCard or None)], True if events were missed)
+    def events_after(self, after, timeout):
+        with self._condition:
+            if self._floor <= after <= self.last:
+                self._condition.wait_for(lambda: self.last > after, timeout)
+            if not self._floor <= after <= self.last:
+                return [], True
+            return [event for event in self._events if event[0] > after], False
+
+    def connect(self, limit):
+        with self._condition:
+            if self.connections >= limit:
+                self.rejected += 1
+                return False
+            self.connections += 1
+            return True
+
+    def disconnect(self):
+        with self._condition:
+            self.connections -= 1
+
+    def stats(self):
+        with self._condition:
+            return {"connections": self.connections, "published": self.published, "rejected": self.rejected}
+
+# <--- IN-PROCESS RELAY --->
+# One process only; posts written through another worker never show up
+class MemoryRelay:
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, action, post_id, data):
+        self.hub.publish(action, post_id, data)
+
+    def start(self):
+        pass
+
+# <--- SHARED SQLITE CHANGE LOG --->
+# Every worker on the host appends to one small SQLite file and each worker's
+# relay thread polls it every `poll_interval` seconds, feeding its own hub. The
+# log's row ids number the events, so a browser that reconnects to another
+# worker resumes where it left off. The thread starts with the first stream or
+# feed page in a worker (never in a preloading master) at the log's end.
+class SQLiteRelay:
+    def __init__(self, hub, path, poll_interval=0.5, retention=3600, busy_timeout=5000):
+        self.hub = hub
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pid = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().execute("CREATE TABLE IF NOT EXISTS changes (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                   "action TEXT NOT NULL, post_id INTEGER NOT NULL, data TEXT, created REAL NOT NULL)")
+
+    # One connection per thread (and per process, after a fork)
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = OFF")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def publish(self, action, post_id, data):
+        self._connection().execute("INSERT INTO changes (action, post_id, data, created) VALUES (?, ?, ?, ?)",
+                                   (action, post_id, None if data is None else json.dumps(data), time.time()))
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            last = self._connection().execute("SELECT coalesce(max(id), 0) FROM changes").fetchone()[0]
+            self.hub.reset(last)
+            thread = threading.Thread(target=self._run, args=(last,), name="live-feed-relay", daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def _run(self, last):
+        polls = 0
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                last = self.poll(last)
+                polls += 1
+                # Rows older than any browser could still resume from
+                if polls % 1000 == 0:
+                    self._connection().execute("DELETE FROM changes WHERE created < ?",
+                                               (time.time() - self.retention,))
+            except sqlite3.Error:
+                # Busy or briefly unavailable; the next poll picks up from `last`
+                pass
+
+    def poll(self, last):
+        rows = self._connection().execute(
+            "SELECT id, action, post_id, data FROM changes WHERE id > ? ORDER BY id LIMIT 500", (last,)).fetchall()
+        for seq, action, post_id, data in rows:
+            self.hub.publish(action, post_id, None if data is None else json.loads(data), seq=seq)
+            last = seq
+        return last
+
+# <--- LIVE FEED --->
+# GET /posts/live is a Server-Sent Events stream of posts created, edited and
+# deleted after the feed page was rendered; posts.html patches itself from it.
+# Each "post" event carries the rendered card (from the fragment cache, with
+# owner controls for the viewer). A stream holds a server thread but no
+# database connection, so at most LIVE_FEED_MAX_CONNECTIONS are open per worker
+# (the rest get a 503 and retry later), each closed after LIVE_FEED_MAX_AGE
+# seconds so browsers reconnect and spread across workers.
+class LiveFeed:
+    def __init__(self, app=None):
+        self.enabled = False
+        self.hub = FeedHub()
+        self.relay = MemoryRelay(self.hub)
+        self.max_connections = 100
+        self.heartbeat = 15.0
+        self.max_age = 300.0
+        self.retry_after = 5
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('LIVE_FEED_ENABLED', False)
+        self.max_connections = app.config.get('LIVE_FEED_MAX_CONNECTIONS', self.max_connections)
+        self.heartbeat = app.config.get('LIVE_FEED_HEARTBEAT', self.heartbeat)
+        self.max_age = app.config.get('LIVE_FEED_MAX_AGE', self.max_age)
+        self.hub = FeedHub()
+        if app.config.get('LIVE_FEED_BACKEND', "memory") == "sqlite":
+            path = app.config.get('LIVE_FEED_DB') or os.path.join(app.instance_path, "live_feed.db")
+            self.relay = SQLiteRelay(self.hub, path, app.config.get('LIVE_FEED_POLL_INTERVAL', 0.5))
+        else:
+            self.relay = MemoryRelay(self.hub)
+        app.add_url_rule('/posts/live', 'live_feed', login_required(self.view))
+        app.extensions['live_feed'] = self
+
+    # Called after the post's transaction has committed
+    def publish(self, action, post_id, post=None):
+        if not self.enabled:
+            return
+        try:
+            self.relay.publish(action, post_id, None if post is None else post_data(post))
+        except sqlite3.Error as e:
+            # The post is saved either way; open feeds just miss this change
+            current_app.logger.warning("Could not publish %s post %s to the live feed: %s", action, post_id, e)
+
+    # Where a page rendered now should start listening from; None when off
+    def position(self):
+        if not self.enabled:
+            return None
+        self.relay.start()
+        return self.hub.last
+
+    def view(self):
+        if not self.enabled:
+            return "", 204
+        self.relay.start()
+        after = request.headers.get("Last-Event-ID") or request.args.get("since")
+        after = int(after) if after and after.isdigit() else self.hub.last
+        if not self.hub.connect(self.max_connections):
+            raise ServiceUnavailable(retry_after=self.retry_after)
+        response = stream_response(self._events(after), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.call_on_close(self.hub.disconnect)
+        return response
+
+    def _events(self, after):
+        yield f"retry: {self.retry_after * 1000}\n\n"
+        deadline = time.monotonic() + self.max_age
+        while time.monotonic() < deadline:
+            events, missed = self.hub.events_after(after, self.heartbeat)
+            if missed:
+                after = self.hub.last
+                yield f"id: {after}\nevent: reload\ndata: {{}}\n\n"
+                continue
+            if not events:
+                # Keeps proxies from timing the stream out and finds closed clients
+                yield ": ping\n\n"
+                continue
+            for seq, action, post_id, post in events:
+                data = {"action": action, "id": post_id}
+                if post is not None:
+                    data["html"] = str(fragment_cache.post_card(FEED_CARD, post))
+                yield f"id: {seq}\nevent: post\ndata: {json.dumps(data)}\n\n"
+                after = seq
+
+    def stats(self):
+        return self.hub.stats()
+
+live_feed = LiveFeed()
@@ -0,0 +1,400 @@
+import atexit
+import fcntl
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from flask import Response, abort, current_app, g, has_request_context, request
+from sqlalchemy import event
+from streaming import stream_open
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+HELP = {
+    "flaskify_http_requests_total": ("counter", "Requests handled, by endpoint, method and status"),
+    "flaskify_http_request_duration_seconds": ("histogram", "Request latency by endpoint"),
+    "flaskify_sql_statements_per_request": ("histogram", "SQL statements issued per request, by endpoint"),
+    "flaskify_sql_statements_total": ("counter", "SQL statements executed, by endpoint"),
+    "flaskify_sql_duration_seconds_total": ("counter", "Time spent executing SQL, by endpoint"),
+    "flaskify_user_cache_hits_total": ("counter", "User loader cache hits"),
+    "flaskify_user_cache_misses_total": ("counter", "User loader cache misses"),
+    "flaskify_user_cache_evictions_total": ("counter", "User loader cache LRU evictions"),
+    "flaskify_user_cache_entries": ("gauge", "Users currently held in the cache"),
+    "flaskify_fragment_cache_hits_total": ("counter", "Post card fragment cache hits"),
+    "flaskify_fragment_cache_misses_total": ("counter", "Post card fragment cache misses"),
+    "flaskify_fragment_cache_entries": ("gauge", "Rendered post cards currently cached"),
+    "flaskify_rate_limited_total": ("counter", "Requests rejected by the rate limiter, by endpoint"),
+    "flaskify_admission_active": ("gauge", "Requests running in each admission group"),
+    "flaskify_admission_queue_depth": ("gauge", "Requests waiting for a slot in each admission group"),
+    "flaskify_admission_rejected_total": ("counter", "Requests turned away because the group's queue was full"),
+    "flaskify_admission_timed_out_total": ("counter", "Requests that waited too long for a slot"),
+    "flaskify_live_feed_connections": ("gauge", "Live feed streams open in this worker"),
+    "flaskify_live_feed_events_total": ("counter", "Post changes delivered to this worker's live feed"),
+    "flaskify_live_feed_rejected_total": ("counter", "Live feed streams refused because the worker was at its cap"),
+    "flaskify_typeahead_entries": ("gauge", "Posts and lessons in this worker's typeahead index"),
+    "flaskify_typeahead_lookups_total": ("counter", "Typeahead prefix lookups"),
+    "flaskify_typeahead_rebuilds_total": ("counter", "Full rebuilds of the typeahead index"),
+    "flaskify_password_hashes_in_flight": ("gauge", "Password hashes queued or running"),
+    "flaskify_password_hashes_rejected_total": ("counter", "Password hashes refused because the queue was full"),
+}
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _is_gauge(name):
+    return HELP.get(name, ("untyped",))[0] == "gauge"
+
+def _process_gone(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+# Counters and histograms summed across snapshots; gauges labelled with the
+# pid of the worker that reported them
+def _merge(snapshots):
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            if _is_gauge(name) and "pid" in snapshot:
+                labels = dict(labels, pid=snapshot["pid"])
+            key = _key(name, labels)
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, counts, total, count in snapshot["histograms"]:
+            key = _key(name, labels)
+            merged = histograms.setdefault(key, [buckets, [0] * len(buckets), 0.0, 0])
+            merged[1] = [a + b for a, b in zip(merged[1], counts)]
+            merged[2] += total
+            merged[3] += count
+    return counters, histograms
+
+# <--- METRICS REGISTRY --->
+# Plain dicts behind one lock; a request costs a handful of dict updates.
+# With METRICS_DIR set, each worker also dumps its totals to
+# METRICS_DIR/<pid>-<random>.json (at most once per METRICS_WRITE_INTERVAL) and
+# /metrics sums every worker's counters and histograms; gauges are reported per
+# worker with a `pid` label instead. A worker exiting folds its counters into
+# METRICS_DIR/retired.json and deletes its file, so totals never go backwards;
+# files not written for METRICS_STALE_AFTER seconds by a process that is gone
+# (a killed worker) get the same treatment at the next scrape.
+class Metrics:
+    def __init__(self, app=None, db=None):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+        self.directory = None
+        self.token = None
+        self.write_interval = 1.0
+        self.stale_after = 300.0
+        self._last_write = 0.0
+        self._path = None
+        self._path_pid = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db, collectors=()):
+        self.collectors = list(collectors)
+        self.directory = app.config.get('METRICS_DIR')
+        self.write_interval = app.config.get('METRICS_WRITE_INTERVAL', 1.0)
+        self.stale_after = app.config.get('METRICS_STALE_AFTER', self.stale_after)
+        self.token = app.config.get('METRICS_TOKEN')
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+                event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+        app.before_request(_start_request)
+        app.after_request(_record_status)
+        app.teardown_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+        app.extensions['metrics'] = self
+
+    # <--- RECORDING --->
+    def inc(self, name, labels, value=1):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [list(buckets), [0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(histogram[0]):
+                if value <= bound:
+                    histogram[1][i] += 1
+                    break
+            histogram[2] += value
+            histogram[3] += 1
+
+    # Recorded at teardown, so a streamed page's time and SQL include its body
+    def _finish_request(self, exc=None):
+        if stream_open() or "metrics_status" not in g:
+            return
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return
+        endpoint = request.endpoint or "unmatched"
+        if endpoint == "metrics":
+            return
+        labels = {"endpoint": endpoint}
+
+        self.inc("flaskify_http_requests_total",
+                 {"endpoint": endpoint, "method": request.method, "status": g.metrics_status})
+        self.observe("flaskify_http_request_duration_seconds", labels,
+                     time.perf_counter() - started, LATENCY_BUCKETS)
+        self.observe("flaskify_sql_statements_per_request", labels,
+                     g.get("sql_statements", 0), QUERY_COUNT_BUCKETS)
+        self.inc("flaskify_sql_statements_total", labels, g.get("sql_statements", 0))
+        self.inc("flaskify_sql_duration_seconds_total", labels, g.get("sql_seconds", 0.0))
+
+        if self.directory and started - self._last_write >= self.write_interval:
+            self._last_write = started
+            self.write_snapshot()
+
+    # <--- EXPORT --->
+    def snapshot(self):
+        with self._lock:
+            counters = [[name, dict(labels), value] for (name, labels), value in self.counters.items()]
+            histograms = [[name, dict(labels), h[0], list(h[1]), h[2], h[3]]
+                          for (name, labels), h in self.histograms.items()]
+        for collector in self.collectors:
+            counters.extend(collector())
+        return {"counters": counters, "histograms": histograms}
+
+    # A fresh name per process, so a worker reusing a dead one's pid never
+    # overwrites its file
+    def _own_path(self):
+        pid = os.getpid()
+        if self._path_pid != pid:
+            self._path = os.path.join(self.directory, f"{pid}-{uuid.uuid4().hex[:8]}.json")
+            self._path_pid = pid
+            atexit.register(self._retire_own, pid)
+        return self._path
+
+    def write_snapshot(self):
+        path = self._own_path()
+        snapshot = self.snapshot()
+        snapshot["pid"] = os.getpid()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+    # Held while files are folded into retired.json or read for a scrape, so a
+    # scrape never counts a file twice
+    def _locked(self):
+        f = open(os.path.join(self.directory, ".lock"), "a")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _retire(self, path):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            snapshot = None
+        if snapshot is not None:
+            retired_path = os.path.join(self.directory, "retired.json")
+            try:
+                with open(retired_path) as f:
+                    retired = json.load(f)
+            except (OSError, ValueError):
+                retired = {"counters": [], "histograms": []}
+            counters, histograms = _merge([retired, snapshot])
+            retired = {"counters": [[name, dict(labels), value] for (name, labels), value in counters.items()
+                                    if not _is_gauge(name)],
+                       "histograms": [[name, dict(labels), *h] for (name, labels), h in histograms.items()]}
+            tmp_path = f"{retired_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(retired, f)
+            os.replace(tmp_path, retired_path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _retire_own(self, pid):
+        if pid != os.getpid() or self._path_pid != pid:
+            return
+        # The last requests since the previous write
+        self.write_snapshot()
+        with self._locked():
+            self._retire(self._path)
+
+    def _snapshots(self):
+        if not self.directory:
+            return [self.snapshot()]
+        self.write_snapshot()
+        now = time.time()
+        snapshots = []
+        with self._locked():
+            for filename in os.listdir(self.directory):
+                if not filename.endswith(".json"):
+                    continue
+                path = os.path.join(self.directory, filename)
+                try:
+                    stale = now - os.path.getmtime(path) > self.stale_after
+                    if stale and filename != "retired.json" and _process_gone(int(filename.split("-")[0].split(".")[0])):
+                        self._retire(path)
+                        continue
+                    with open(path) as f:
+                        snapshot = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if stale:
+                    # An idle worker's gauges are out of date
+                    snapshot["counters"] = [row for row in snapshot["counters"] if not _is_gauge(row[0])]
+                snapshots.append(snapshot)
+        return snapshots
+
+    def render(self):
+        counters, histograms = _merge(self._snapshots())
+        lines = []
+        for metric in sorted({name for name, _ in counters} | {name for name, _ in histograms}):
+            kind, help_text = HELP.get(metric, ("untyped", metric))
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+                if name != metric:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    # Route names, traffic and worker pids are not for everyone: without
+    # METRICS_TOKEN the page is only served in debug mode
+    def view(self):
+        if not self.token and not current_app.debug:
+            abort(404)
+        supplied = request.headers.get("Authorization", "")
+        if self.token and not hmac.compare_digest(supplied.encode(), f"Bearer {self.token}".encode()):
+            abort(401)
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+# <--- SQL + REQUEST HOOKS --->
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.sql_statements = 0
+    g.sql_seconds = 0.0
+
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+# The start time lives on the statement's own execution context, so one that
+# fails (and never reaches the after hook) leaves nothing behind on the pooled
+# connection
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_query_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "metrics_query_start", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    if has_request_context() and "metrics_started" in g:
+        g.sql_statements += 1
+        g.sql_seconds += elapsed
+
+# Exposes a UserCache's counters alongside the request metrics
+def user_cache_collector(cache):
+    def collect():
+        stats = cache.stats()
+        return [
+            ["flaskify_user_cache_hits_total", {}, stats["hits"]],
+            ["flaskify_user_cache_misses_total", {}, stats["misses"]],
+            ["flaskify_user_cache_evictions_total", {}, stats["evictions"]],
+            ["flaskify_user_cache_entries", {}, stats["size"]],
+        ]
+    return collect
+
+def fragment_cache_collector(cache):
+    def collect():
+        stats = cache.stats()
+        return [
+            ["flaskify_fragment_cache_hits_total", {}, stats["hits"]],
+            ["flaskify_fragment_cache_misses_total", {}, stats["misses"]],
+            ["flaskify_fragment_cache_entries", {}, stats["size"]],
+        ]
+    return collect
+
+def password_hasher_collector(hasher):
+    def collect():
+        stats = hasher.stats()
+        return [
+            ["flaskify_password_hashes_in_flight", {}, stats["in_flight"]],
+            ["flaskify_password_hashes_rejected_total", {}, stats["rejected"]],
+        ]
+    return collect
+
+def rate_limiter_collector(limiter):
+    def collect():
+        return [["flaskify_rate_limited_total", {"endpoint": endpoint}, count]
+                for endpoint, count in limiter.stats().items()]
+    return collect
+
+def admission_collector(admission):
+    def collect():
+        rows = []
+        for name, stats in admission.stats().items():
+            labels = {"group": name}
+            rows += [
+                ["flaskify_admission_active", labels, stats["active"]],
+                ["flaskify_admission_queue_depth", labels, stats["waiting"]],
+                ["flaskify_admission_rejected_total", labels, stats["rejected"]],
+                ["flaskify_admission_timed_out_total", labels, stats["timed_out"]],
+            ]
+        return rows
+    return collect
+
+def live_feed_collector(feed):
+    def collect():
+        stats = feed.stats()
+        return [
+            ["flaskify_live_feed_connections", {}, stats["connections"]],
+            ["flaskify_live_feed_events_total", {}, stats["published"]],
+            ["flaskify_live_feed_rejected_total", {}, stats["rejected"]],
+        ]
+    return collect
+
+def typeahead_collector(index):
+    def collect():
+        stats = index.stats()
+        return [
+            ["flaskify_typeahead_entries", {}, stats["entries"]],
+            ["flaskify_typeahead_lookups_total", {}, stats["lookups"]],
+            ["flaskify_typeahead_rebuilds_total", {}, stats["rebuilds"]],
+        ]
+    return collect
+
+metrics = Metrics()
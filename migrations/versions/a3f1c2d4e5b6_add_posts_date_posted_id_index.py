@@ -0,0 +1,26 @@
+"""Add (date_posted, id) index to posts
+
+Revision ID: a3f1c2d4e5b6
+Revises: 9e9694f5f236
+Create Date: 2026-10-18 09:12:04.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c2d4e5b6'
+down_revision = '9e9694f5f236'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index('ix_posts_date_posted_id', ['date_posted', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_date_posted_id')
@@ -0,0 +1,57 @@
+"""Add FTS5 search index over posts
+
+Revision ID: b7d2e9f0a1c3
+Revises: a3f1c2d4e5b6
+Create Date: 2026-10-18 10:41:27.553019
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e9f0a1c3'
+down_revision = 'a3f1c2d4e5b6'
+branch_labels = None
+depends_on = None
+
+
+def fts5_available(connection):
+    try:
+        connection.exec_driver_sql("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        connection.exec_driver_sql("DROP TABLE temp.fts5_probe")
+        return True
+    except sa.exc.OperationalError:
+        return False
+
+
+def upgrade():
+    connection = op.get_bind()
+    # SQLite builds without FTS5 keep using the LIKE fallback in search_index.py
+    if not fts5_available(connection):
+        return
+
+    # Frozen copy of search_index.FTS_STATEMENTS as of this revision; later
+    # changes there need a migration of their own
+    op.execute("""CREATE VIRTUAL TABLE posts_fts USING fts5(
+        title, content, content='posts', content_rowid='id', tokenize='unicode61'
+    )""")
+    op.execute("""CREATE TRIGGER posts_fts_ai AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""")
+    op.execute("""CREATE TRIGGER posts_fts_ad AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""")
+    op.execute("""CREATE TRIGGER posts_fts_au AFTER UPDATE OF title, content ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""")
+    # Index every post written before this migration
+    op.execute("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS posts_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS posts_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS posts_fts_ai")
+    op.execute("DROP TABLE IF EXISTS posts_fts")
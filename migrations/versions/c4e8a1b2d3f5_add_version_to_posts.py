@@ -0,0 +1,27 @@
+"""Add version to posts
+
+Revision ID: c4e8a1b2d3f5
+Revises: b7d2e9f0a1c3
+Create Date: 2026-10-18 13:05:52.304417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a1b2d3f5'
+down_revision = 'b7d2e9f0a1c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    # Plain ALTER TABLE DROP COLUMN (SQLite 3.35+); a batch rebuild of posts
+    # would drop the posts_fts triggers
+    op.drop_column('posts', 'version')
@@ -0,0 +1,34 @@
+"""Add post_count to users and (user_id, date_posted, id) index to posts
+
+Revision ID: d1f3a5b7c9e2
+Revises: c4e8a1b2d3f5
+Create Date: 2026-10-18 17:31:26.540118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1f3a5b7c9e2'
+down_revision = 'c4e8a1b2d3f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('post_count', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute("UPDATE users SET post_count = "
+               "(SELECT count(*) FROM posts WHERE posts.user_id = users.id)")
+
+    # Plain CREATE INDEX; a batch rebuild of posts would drop the posts_fts triggers
+    op.create_index('ix_posts_user_id_date_posted_id', 'posts', ['user_id', 'date_posted', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_posts_user_id_date_posted_id', table_name='posts')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('post_count')
@@ -0,0 +1,43 @@
+"""Add lesson_completions and lesson_stats
+
+Revision ID: e6a2c8d4f1b3
+Revises: d1f3a5b7c9e2
+Create Date: 2026-10-18 17:52:10.671904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a2c8d4f1b3'
+down_revision = 'd1f3a5b7c9e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('lesson_completions',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('lesson_id', sa.String(length=100), nullable=False),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'lesson_id')
+    )
+    with op.batch_alter_table('lesson_completions', schema=None) as batch_op:
+        batch_op.create_index('ix_lesson_completions_lesson_id', ['lesson_id'], unique=False)
+
+    op.create_table('lesson_stats',
+    sa.Column('lesson_id', sa.String(length=100), nullable=False),
+    sa.Column('completions', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('lesson_id')
+    )
+    # Fill both from users.progress with `flask backfill-lesson-stats`
+
+
+def downgrade():
+    op.drop_table('lesson_stats')
+    with op.batch_alter_table('lesson_completions', schema=None) as batch_op:
+        batch_op.drop_index('ix_lesson_completions_lesson_id')
+
+    op.drop_table('lesson_completions')
@@ -2,32 +2,41 @@ from flask_login import UserMixin
 from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from flask import Flask
 from flask_ckeditor import CKEditor
 from sqlalchemy.dialects.sqlite import JSON
-import os, random
+from database import RoutingSession
+from avatars import get_random_avatar
 
-AVATAR_FOLDER = "static/avatars"
-def get_random_avatar():
-    avatars = os.listdir(AVATAR_FOLDER)
-    return os.path.join("static/avatars", random.choice(avatars))
+def utc_now():
+    return datetime.now(timezone.utc)
 
-app = Flask(__name__)
-ckeditor = CKEditor(app)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///users.db"
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+# Extensions are bound to an app in create_app()
+ckeditor = CKEditor()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+migrate = Migrate()
 
 # Blog Post Model
 class Posts(db.Model):
+    # Back the keyset pagination on the community feed and on a user's profile
+    # (the second also serves the per-user post lookups)
+    __table_args__ = (db.Index("ix_posts_date_posted_id", "date_posted", "id"),
+                      db.Index("ix_posts_user_id_date_posted_id", "user_id", "date_posted", "id"))
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(999))
     content = db.Column(db.Text)
     author = db.Column(db.String(999))
-    date_posted = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    date_posted = db.Column(db.DateTime, default=utc_now)
     user_id = db.Column(db.Integer)
-    profile_picture = db.Column(db.String(), default=get_random_avatar())
+    profile_picture = db.Column(db.String(), default=get_random_avatar)
+    # Bumped on every edit; part of the rendered post card cache key
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+# What the pages actually render. Querying these columns returns plain rows:
+# nothing enters the identity map and nothing is tracked for changes.
+POST_CARD_COLUMNS = (Posts.id, Posts.title, Posts.content, Posts.author, Posts.date_posted,
+                     Posts.user_id, Posts.profile_picture, Posts.version)
+POST_DETAIL_COLUMNS = (Posts.id, Posts.title, Posts.content, Posts.author, Posts.date_posted)
 
 # Create User Model
 class Users(db.Model, UserMixin):
@@ -35,8 +44,27 @@ class Users(db.Model, UserMixin):
     name = db.Column(db.String(200), nullable=False)
     email = db.Column(db.String(200), nullable=False, unique=True)
     password = db.Column(db.String(200), nullable=False)
-    date_added = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    date_added = db.Column(db.DateTime, default=utc_now)
     bio = db.Column(db.String(9999))
-    profile_picture = db.Column(db.String(), default=get_random_avatar())
+    profile_picture = db.Column(db.String(), default=get_random_avatar)
     aspiring_job = db.Column(db.String(9999))
-    progress = db.Column(JSON, default=list)
\ No newline at end of file
+    progress = db.Column(JSON, default=list)
+    # Kept in step by add_post/delete_post; enforces MAX_POSTS_PER_USER
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+# One row per completed lesson per user, kept in step with Users.progress
+class LessonCompletion(db.Model):
+    __tablename__ = "lesson_completions"
+    __table_args__ = (db.Index("ix_lesson_completions_lesson_id", "lesson_id"),)
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    lesson_id = db.Column(db.String(100), primary_key=True)
+    completed_at = db.Column(db.DateTime, default=utc_now)
+
+# Running totals: completions per lesson, plus the number of users under
+# lesson_id "*"
+class LessonStats(db.Model):
+    __tablename__ = "lesson_stats"
+
+    lesson_id = db.Column(db.String(100), primary_key=True)
+    completions = db.Column(db.Integer, nullable=False, default=0, server_default="0")
@@ -0,0 +1,104 @@
+from datetime import datetime
+from sqlalchemy import tuple_
+from models import db
+from streaming import StreamedRows
+
+CURSOR_DATE_FORMAT = "%Y%m%d%H%M%S%f"
+
+# Cursors look like "20250919162721863772-42" (date_posted, then id)
+def encode_cursor(date_posted, id):
+    return f"{date_posted.strftime(CURSOR_DATE_FORMAT)}-{id}"
+
+def decode_cursor(cursor):
+    try:
+        date_part, id_part = cursor.split("-", 1)
+        return datetime.strptime(date_part, CURSOR_DATE_FORMAT), int(id_part)
+    except (AttributeError, ValueError):
+        return None
+
+class KeysetPage:
+    def __init__(self, items, has_older, has_newer):
+        self.items = items
+        self.has_older = has_older
+        self.has_newer = has_newer
+
+    @property
+    def older_cursor(self):
+        if not (self.items and self.has_older):
+            return None
+        last = self.items[-1]
+        return encode_cursor(last.date_posted, last.id)
+
+    @property
+    def newer_cursor(self):
+        if not (self.items and self.has_newer):
+            return None
+        first = self.items[0]
+        return encode_cursor(first.date_posted, first.id)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+# Same interface, over rows still being read from the cursor
+class StreamedKeysetPage:
+    def __init__(self, execute, per_page, has_newer):
+        self.rows = StreamedRows(execute, per_page)
+        self.has_newer = has_newer
+
+    @property
+    def has_older(self):
+        self.rows.read_all()
+        return self.rows.has_more
+
+    @property
+    def older_cursor(self):
+        if not self.has_older:
+            return None
+        return encode_cursor(self.rows.last.date_posted, self.rows.last.id)
+
+    @property
+    def newer_cursor(self):
+        if not (self.rows and self.has_newer):
+            return None
+        return encode_cursor(self.rows.first.date_posted, self.rows.first.id)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __bool__(self):
+        return bool(self.rows)
+
+# <--- KEYSET PAGINATION --->
+# Newest first, keyed on (date_posted, id) so every page is a single index range
+# scan of per_page + 1 rows, no matter how deep into the feed the reader is.
+# `before` pages towards older rows, `after` pages back towards newer ones.
+# With stream=True the newest-first pages come back as a StreamedKeysetPage
+# read `yield_per` rows at a time; `after` pages are reversed, so they are
+# always read in full.
+def paginate_keyset(query, date_column, id_column, per_page, before=None, after=None,
+                    stream=False, yield_per=100):
+    key = tuple_(date_column, id_column)
+
+    if after is not None:
+        rows = (query
+                .filter(key > tuple_(*after))
+                .order_by(date_column.asc(), id_column.asc())
+                .limit(per_page + 1)
+                .all())
+        has_newer = len(rows) > per_page
+        return KeysetPage(list(reversed(rows[:per_page])), has_older=True, has_newer=has_newer)
+
+    if before is not None:
+        query = query.filter(key < tuple_(*before))
+    query = query.order_by(date_column.desc(), id_column.desc()).limit(per_page + 1)
+    if stream:
+        statement = query.statement
+        return StreamedKeysetPage(
+            lambda: db.session.execute(statement, execution_options={"yield_per": yield_per}),
+            per_page, has_newer=before is not None)
+    rows = query.all()
+    has_older = len(rows) > per_page
+    return KeysetPage(rows[:per_page], has_older=has_older, has_newer=before is not None)
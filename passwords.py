@@ -0,0 +1,119 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full or a hash outlasts
+    PASSWORD_HASH_TIMEOUT; the app answers 503."""
+
+# Run inside the pool's worker processes
+def _hash(password, method, salt_length):
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+def _verify(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+# "pbkdf2:sha256" -> "pbkdf2:sha256:1000000", "scrypt" -> "scrypt:32768:8:1", the
+# way werkzeug writes the method into a stored hash
+def normalize_method(method):
+    parts = method.split(":")
+    if parts[0] == "pbkdf2":
+        if len(parts) == 1:
+            parts.append("sha256")
+        if len(parts) == 2:
+            parts.append(str(DEFAULT_PBKDF2_ITERATIONS))
+    elif parts[0] == "scrypt":
+        defaults = ["32768", "8", "1"]
+        parts += defaults[len(parts) - 1:]
+    return ":".join(parts)
+
+# <--- PASSWORD HASHING --->
+# pbkdf2/scrypt are deliberately slow. They run in a small process pool so a
+# burst of logins doesn't hold the GIL the worker's other threads need for
+# feed and lesson pages. At most PASSWORD_HASH_QUEUE hashes may be in flight
+# per worker; beyond that requests fail fast with a 503 rather than queueing.
+# PASSWORD_HASH_WORKERS=0 hashes on the request thread.
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.method = normalize_method("pbkdf2:sha256")
+        self.salt_length = 16
+        self.workers = 0
+        self.timeout = 10
+        self.queue_size = 4
+        self.in_flight = 0
+        self.rejected = 0
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = normalize_method(app.config.get('PASSWORD_HASH_METHOD', "pbkdf2:sha256"))
+        self.salt_length = app.config.get('PASSWORD_SALT_LENGTH', self.salt_length)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self.queue_size = app.config.get('PASSWORD_HASH_QUEUE') or max(1, self.workers) * 4
+        app.extensions['password_hasher'] = self
+
+    # Started on first use in each process: a pool made before a pre-fork
+    # server forks would be shared by (and broken in) every worker
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pool_pid = os.getpid()
+                atexit.register(self._pool.shutdown, wait=False, cancel_futures=True)
+            return self._pool
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self.in_flight >= self.queue_size:
+                self.rejected += 1
+                raise HashingBusy()
+            self.in_flight += 1
+        if self.workers <= 0:
+            try:
+                return fn(*args)
+            finally:
+                self._done()
+        try:
+            future = self._executor().submit(fn, *args)
+        except BaseException:
+            self._done()
+            raise
+        # A hash that times out keeps its pool slot until it finishes, so it
+        # stays in flight until then too
+        future.add_done_callback(self._done)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HashingBusy() from None
+
+    def _done(self, future=None):
+        with self._lock:
+            self.in_flight -= 1
+
+    def hash(self, password):
+        return self._run(_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run(_verify, pwhash, password)
+
+    # Hashes made with an older method, cost or salt length
+    def needs_rehash(self, pwhash):
+        method, _, rest = pwhash.partition("$")
+        salt = rest.partition("$")[0]
+        return normalize_method(method) != self.method or len(salt) != self.salt_length
+
+    def stats(self):
+        return {"method": self.method, "workers": self.workers, "queue_size": self.queue_size,
+                "in_flight": self.in_flight, "rejected": self.rejected}
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,257 @@
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import click
+from flask import current_app, g, request
+from flask.cli import AppGroup
+from sqlalchemy import event
+from streaming import stream_open
+
+# sqlite3 cursor methods whose C call is labelled with the SQL being run
+SQL_CALLS = frozenset({"Cursor.execute", "Cursor.executemany"})
+SQL_LABEL_LENGTH = 200
+
+def _clean(label):
+    return " ".join(label.replace(";", ",").split())
+
+# <--- CALL TREE --->
+# A sys.setprofile hook for one thread. Every call becomes a node under its
+# caller, holding the time spent in the function itself; the sqlite3 execute
+# call a statement runs in is named after its SQL, so queries sit in the tree
+# exactly where they were issued. Frames already running when the hook is
+# installed are ignored.
+class CallTree:
+    def __init__(self):
+        self.root = [0.0, {}]
+        # [node, started, seconds spent in callees]
+        self.stack = []
+        self.sql = None
+        self.started = time.perf_counter()
+
+    def _push(self, label, now):
+        parent = self.stack[-1][0] if self.stack else self.root
+        node = parent[1].get(label)
+        if node is None:
+            node = parent[1][label] = [0.0, {}]
+        self.stack.append([node, now, 0.0])
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == "call":
+            code = frame.f_code
+            self._push(f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}", now)
+        elif event == "c_call":
+            name = getattr(arg, "__qualname__", None) or repr(arg)
+            if self.sql is not None and name in SQL_CALLS:
+                label, self.sql = "sql: " + _clean(self.sql)[:SQL_LABEL_LENGTH], None
+            else:
+                label = f"{getattr(arg, '__module__', None) or 'builtins'}:{name}"
+            self._push(label, now)
+        elif self.stack:
+            node, started, children = self.stack.pop()
+            elapsed = now - started
+            node[0] += elapsed - children
+            if self.stack:
+                self.stack[-1][2] += elapsed
+
+    # Collapsed stacks ("a;b;c <microseconds>"), as read by flamegraph.pl,
+    # speedscope and inferno
+    def folded(self, prefix):
+        lines = []
+        pending = [((prefix,), self.root)]
+        while pending:
+            path, (seconds, children) = pending.pop()
+            micros = round(seconds * 1_000_000)
+            if micros and len(path) > 1:
+                lines.append(f"{';'.join(path)} {micros}")
+            for label, child in children.items():
+                pending.append((path + (_clean(label),), child))
+        lines.sort()
+        return "\n".join(lines) + "\n"
+
+# <--- REQUEST PROFILER --->
+# Opt-in per request: a request carrying PROFILER_TOKEN in the X-Profile header,
+# or a random PROFILER_SAMPLE_RATE share of requests, runs under a CallTree and
+# its folded stacks are written to PROFILER_DIR. `flask profiler on|off` writes
+# a control file that every worker re-reads within a second, so no restart is
+# needed; while it is off a request costs a clock read and a flag check.
+class RequestProfiler:
+    def __init__(self, app=None):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.token = None
+        self.directory = None
+        self.keep = 200
+        self.control_file = None
+        self._defaults = (False, 0.0)
+        self._control_checked = 0.0
+        self._control_mtime = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._engines = set()
+        self._count = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._defaults = (app.config.get('PROFILER_ENABLED', False), app.config.get('PROFILER_SAMPLE_RATE', 0.0))
+        self.enabled, self.sample_rate = self._defaults
+        self.token = app.config.get('PROFILER_TOKEN')
+        self.directory = app.config.get('PROFILER_DIR') or os.path.join(app.instance_path, "profiles")
+        self.keep = app.config.get('PROFILER_KEEP', 200)
+        self.control_file = (app.config.get('PROFILER_CONTROL_FILE')
+                             or os.path.join(app.instance_path, "profiler.json"))
+        self._control_checked = 0.0
+        self._control_mtime = None
+
+        # First, so the profile also covers rate limiting and admission waits
+        app.before_request_funcs.setdefault(None, []).insert(0, self.start)
+        app.after_request(self._add_header)
+        app.teardown_request(self.finish)
+        app.cli.add_command(profiler_command)
+        app.extensions['request_profiler'] = self
+
+    # <--- RUNTIME SWITCH --->
+    def refresh(self, now=None):
+        now = time.monotonic() if now is None else now
+        if now - self._control_checked < 1.0:
+            return
+        self._control_checked = now
+        try:
+            mtime = os.stat(self.control_file).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._control_mtime:
+            return
+        self._control_mtime = mtime
+        self.enabled, self.sample_rate = read_control(self.control_file, self._defaults)
+
+    def _should_profile(self):
+        self.refresh()
+        if not self.enabled:
+            return None
+        header = request.headers.get("X-Profile")
+        if header and self.token and hmac.compare_digest(header.encode(), self.token.encode()):
+            return "header"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    # <--- REQUEST HOOKS --->
+    def start(self):
+        reason = self._should_profile()
+        if reason is None:
+            return
+        self._listen()
+        with self._lock:
+            self._count += 1
+            count = self._count
+        g.profile_file = (f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unknown'}"
+                          f"-{os.getpid()}-{count}.folded")
+        g.profile_reason = reason
+        tree = self._local.tree = CallTree()
+        sys.setprofile(tree)
+
+    def _add_header(self, response):
+        if "profile_file" in g:
+            response.headers["X-Profile-File"] = g.profile_file
+        return response
+
+    # A streamed page is profiled until its last chunk is sent
+    def finish(self, exc=None):
+        tree = getattr(self._local, "tree", None)
+        if tree is None or stream_open():
+            return
+        sys.setprofile(None)
+        self._local.tree = None
+        elapsed_ms = (time.perf_counter() - tree.started) * 1000
+        try:
+            self._write(g.profile_file, tree.folded(f"{request.method} {request.endpoint or request.path}"))
+        except OSError as e:
+            current_app.logger.warning("Could not write request profile: %s", e)
+            return
+        current_app.logger.info("Profiled %s %s (%s, %.1f ms) -> %s", request.method, request.path,
+                                g.profile_reason, elapsed_ms, g.profile_file)
+
+    def _write(self, filename, folded):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, filename), "w") as f:
+            f.write(folded)
+        profiles = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith(".folded")),
+                          key=lambda entry: entry.stat().st_mtime)
+        for entry in profiles[:max(0, len(profiles) - self.keep)]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    # <--- SQL LABELS --->
+    # Attached the first time a request is profiled, so apps that never turn
+    # the profiler on run no extra listener per statement
+    def _listen(self):
+        db = current_app.extensions['sqlalchemy']
+        with self._lock:
+            for engine in db.engines.values():
+                if engine not in self._engines:
+                    event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+                    self._engines.add(engine)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        tree = getattr(self._local, "tree", None)
+        if tree is not None:
+            tree.sql = statement
+
+request_profiler = RequestProfiler()
+
+# <--- CONTROL FILE --->
+def read_control(path, defaults=(False, 0.0)):
+    try:
+        with open(path) as f:
+            control = json.load(f)
+    except (OSError, ValueError):
+        return defaults
+    return bool(control.get("enabled", defaults[0])), float(control.get("sample_rate", defaults[1]))
+
+def write_control(path, enabled, sample_rate):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump({"enabled": enabled, "sample_rate": sample_rate}, f)
+    os.replace(temporary, path)
+
+@click.group("profiler", cls=AppGroup)
+def profiler_command():
+    """Turn request profiling on or off for every running worker."""
+
+@profiler_command.command("on")
+@click.option("--sample-rate", type=click.FloatRange(0, 1), default=None,
+              help="Share of requests to profile (default: keep the current rate)")
+def profiler_on(sample_rate):
+    """Profile requests sent with X-Profile: <PROFILER_TOKEN>, plus a random sample."""
+    profiler = current_app.extensions['request_profiler']
+    _, current_rate = read_control(profiler.control_file, profiler._defaults)
+    write_control(profiler.control_file, True, current_rate if sample_rate is None else sample_rate)
+    _echo_status(profiler)
+
+@profiler_command.command("off")
+def profiler_off():
+    """Stop profiling requests."""
+    profiler = current_app.extensions['request_profiler']
+    _, current_rate = read_control(profiler.control_file, profiler._defaults)
+    write_control(profiler.control_file, False, current_rate)
+    _echo_status(profiler)
+
+@profiler_command.command("status")
+def profiler_status():
+    """Show whether requests are being profiled."""
+    _echo_status(current_app.extensions['request_profiler'])
+
+def _echo_status(profiler):
+    enabled, sample_rate = read_control(profiler.control_file, profiler._defaults)
+    click.echo(f"Profiling {'on' if enabled else 'off'}, sample rate {sample_rate:g}, "
+               f"header trigger {'set' if profiler.token else 'unset (PROFILER_TOKEN)'}")
+    click.echo(f"Profiles: {profiler.directory}")
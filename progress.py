@@ -0,0 +1,121 @@
+import atexit
+import threading
+from models import db, Users
+from user_cache import user_cache
+from lesson_stats import record_progress_change
+from valid_url import is_valid
+
+def clean_lesson_ids(values):
+    if not isinstance(values, list):
+        return None
+    if not all(isinstance(v, str) and is_valid(v) for v in values):
+        return None
+    return values
+
+# Apply {lesson_id: completed} changes to a progress list, keeping its order.
+# Returns None when the result is identical, so callers can skip the write.
+def apply_changes(progress, changes):
+    current = list(progress or [])
+    completed = set(current)
+    updated = [lesson for lesson in current if changes.get(lesson, True)]
+    updated += [lesson for lesson, done in changes.items() if done and lesson not in completed]
+    return None if updated == current else updated
+
+# <--- WRITE-BEHIND PROGRESS BUFFER --->
+# Checkbox toggles are merged per user in memory and written in one transaction
+# once the flush delay has passed, so a burst of clicks costs a single commit.
+class ProgressBuffer:
+    def __init__(self, app=None):
+        self.app = None
+        self._atexit_registered = False
+        self.flush_delay = 0
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_delay = app.config.get('PROGRESS_FLUSH_DELAY', 0)
+        if not self._atexit_registered:
+            atexit.register(self.flush)
+            self._atexit_registered = True
+
+    # Latest change wins, so on/off/on within one window is a single "on"
+    def record(self, user_id, added, removed):
+        with self._lock:
+            changes = self._pending.setdefault(user_id, {})
+            for lesson in removed:
+                changes[lesson] = False
+            for lesson in added:
+                changes[lesson] = True
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def pending_for(self, user_id):
+        with self._lock:
+            return dict(self._pending.get(user_id, {}))
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        if not pending:
+            return 0
+
+        written = 0
+        with self.app.app_context():
+            users = Users.query.filter(Users.id.in_(pending)).all()
+            for user in users:
+                updated = apply_changes(user.progress, pending[user.id])
+                if updated is not None:
+                    record_progress_change(user.id, user.progress, updated)
+                    user.progress = updated
+                    written += 1
+            if written:
+                db.session.commit()
+        for user_id in pending:
+            user_cache.invalidate(user_id)
+        return written
+
+progress_buffer = ProgressBuffer()
+
+# Progress as the user should see it, including toggles not yet flushed
+def progress_for(user, buffer):
+    progress = list(user.progress or [])
+    updated = apply_changes(progress, buffer.pending_for(user.id))
+    return progress if updated is None else updated
+
+# The same, read from the users row: current_user is a cached snapshot that
+# another worker's writes may have overtaken, so it must never decide a write
+def stored_progress_for(user_id, buffer):
+    stored = db.session.execute(db.select(Users.progress).where(Users.id == user_id)).scalar()
+    progress = list(stored or [])
+    updated = apply_changes(progress, buffer.pending_for(user_id))
+    return progress if updated is None else updated
+
+# Returns whether the stored progress changed (or, when buffered, will change)
+def save_changes(user_id, added, removed, buffer):
+    changes = {lesson: False for lesson in removed}
+    changes.update({lesson: True for lesson in added})
+
+    if buffer.flush_delay > 0:
+        if apply_changes(stored_progress_for(user_id, buffer), changes) is None:
+            return False
+        buffer.record(user_id, added, removed)
+        return True
+
+    row = db.session.get(Users, user_id)
+    updated = apply_changes(row.progress, changes)
+    if updated is None:
+        return False
+    record_progress_change(row.id, row.progress, updated)
+    row.progress = updated
+    db.session.commit()
+    user_cache.invalidate(user_id)
+    return True
@@ -0,0 +1,163 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import request, session
+from werkzeug.exceptions import TooManyRequests
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# "10/minute" -> (capacity 10, refill 10/60 tokens per second)
+def parse_limit(limit):
+    count, _, period = limit.partition("/")
+    count = int(count)
+    return count, count / PERIODS[period.strip().rstrip("s")]
+
+# <--- IN-MEMORY BUCKETS --->
+# One process only; each gunicorn worker would allow the full limit
+class MemoryBackend:
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    # Returns (allowed, seconds until a token is available)
+    def take(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+# <--- SHARED SQLITE BUCKETS --->
+# A small SQLite file shared by every worker on the host. Taking a token is a
+# single UPSERT, so concurrent workers can't both spend the last one; the
+# WHERE clause leaves the row untouched (and returns nothing) when empty.
+TAKE_SQL = """
+INSERT INTO buckets (key, tokens, updated) VALUES (:key, :capacity - 1, :now)
+ON CONFLICT (key) DO UPDATE
+   SET tokens = min(:capacity, tokens + (:now - updated) * :rate) - 1, updated = :now
+ WHERE min(:capacity, tokens + (:now - updated) * :rate) >= 1
+RETURNING tokens
+"""
+
+class SQLiteBackend:
+    def __init__(self, path, busy_timeout=5000, prune_every=1000):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._calls = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS buckets "
+                               "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+
+    # One connection per thread (and per process, after a fork)
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = OFF")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def take(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        connection = self._connection()
+        params = {"key": key, "capacity": capacity, "rate": rate, "now": now}
+        if connection.execute(TAKE_SQL, params).fetchone() is not None:
+            self._maybe_prune(connection, now)
+            return True, 0.0
+        row = connection.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+        tokens = min(capacity, row[0] + (now - row[1]) * rate) if row else 0
+        return False, (1 - tokens) / rate
+
+    # Buckets untouched for a day are full again and can go
+    def _maybe_prune(self, connection, now):
+        self._calls += 1
+        if self._calls % self.prune_every == 0:
+            connection.execute("DELETE FROM buckets WHERE updated < ?", (now - 86400,))
+
+    def reset(self):
+        self._connection().execute("DELETE FROM buckets")
+
+# <--- RATE LIMITER --->
+# Token buckets per (route, client), where the client is the logged-in user id
+# or else the remote address. Limits come from RATE_LIMITS, e.g.
+# {"POST login": "10/minute", "search": "30/minute"}; a method prefix limits
+# only that method. The check is the app's first before_request hook, so a
+# rejected request never reaches CSRF/form parsing, the user loader or the DB.
+class RateLimiter:
+    def __init__(self, app=None):
+        self.enabled = True
+        self.backend = MemoryBackend()
+        self.limits = {}
+        self.rejected = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        self.limits = {}
+        for rule, limit in (app.config.get('RATE_LIMITS') or {}).items():
+            method, _, endpoint = rule.rpartition(" ")
+            self.limits[(method.upper() or None, endpoint)] = parse_limit(limit)
+
+        if app.config.get('RATE_LIMIT_BACKEND', "memory") == "sqlite":
+            path = app.config.get('RATE_LIMIT_DB') or os.path.join(app.instance_path, "rate_limits.db")
+            self.backend = SQLiteBackend(path)
+        else:
+            self.backend = MemoryBackend()
+
+        app.before_request_funcs.setdefault(None, []).insert(0, self.check)
+        app.extensions['rate_limiter'] = self
+
+    def limit_for(self, endpoint, method):
+        limit = self.limits.get((method, endpoint))
+        if limit is None:
+            limit = self.limits.get((None, endpoint))
+        return limit
+
+    @staticmethod
+    def client_key():
+        # Read straight from the session cookie; no user loader query
+        user_id = session.get("_user_id")
+        return f"user:{user_id}" if user_id else f"ip:{request.remote_addr}"
+
+    def check(self):
+        if not self.enabled or request.endpoint is None:
+            return
+        limit = self.limit_for(request.endpoint, request.method)
+        if limit is None:
+            return
+        capacity, rate = limit
+        allowed, retry_after = self.backend.take(f"{request.endpoint}:{self.client_key()}", capacity, rate)
+        if not allowed:
+            with self._lock:
+                self.rejected[request.endpoint] = self.rejected.get(request.endpoint, 0) + 1
+            raise TooManyRequests(retry_after=max(1, math.ceil(retry_after)))
+
+    def stats(self):
+        with self._lock:
+            return dict(self.rejected)
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,186 @@
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import event, text, Integer, String, Text, DateTime
+from sqlalchemy.exc import OperationalError
+from models import db, Posts
+from streaming import StreamedRows
+
+# Sentinels wrapped around matches by snippet()/highlight(); the text is escaped
+# first and the sentinels swapped for <mark> afterwards so user content stays safe
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+# Title hits count for more than content hits when ranking
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+# External-content FTS5 table over posts(title, content), kept in sync by triggers
+FTS_STATEMENTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+        title, content, content='posts', content_rowid='id', tokenize='unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF title, content ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+DROP_STATEMENTS = [
+    "DROP TRIGGER IF EXISTS posts_fts_au",
+    "DROP TRIGGER IF EXISTS posts_fts_ad",
+    "DROP TRIGGER IF EXISTS posts_fts_ai",
+    "DROP TABLE IF EXISTS posts_fts",
+]
+
+RESULT_COLUMNS = dict(id=Integer, title=String, content=Text, author=String,
+                      date_posted=DateTime, profile_picture=String,
+                      title_html=String, snippet=String)
+
+FTS_SEARCH = text(f"""
+    SELECT posts.id, posts.title, posts.content, posts.author, posts.date_posted,
+           posts.profile_picture,
+           highlight(posts_fts, 0, '{MATCH_START}', '{MATCH_END}') AS title_html,
+           snippet(posts_fts, 1, '{MATCH_START}', '{MATCH_END}', '…', 16) AS snippet
+    FROM posts_fts
+    JOIN posts ON posts.id = posts_fts.rowid
+    WHERE posts_fts MATCH :query
+    ORDER BY bm25(posts_fts, {TITLE_WEIGHT}, {CONTENT_WEIGHT}), posts.id DESC
+    LIMIT :limit OFFSET :offset
+""").columns(**RESULT_COLUMNS)
+
+LIKE_SEARCH = text(r"""
+    SELECT posts.id, posts.title, posts.content, posts.author, posts.date_posted,
+           posts.profile_picture, posts.title AS title_html, posts.content AS snippet
+    FROM posts
+    WHERE posts.title LIKE :pattern ESCAPE '\' OR posts.content LIKE :pattern ESCAPE '\'
+    ORDER BY posts.title LIKE :pattern ESCAPE '\' DESC, posts.date_posted DESC, posts.id DESC
+    LIMIT :limit OFFSET :offset
+""").columns(**RESULT_COLUMNS)
+
+# Keyed by engine URL, so each database is only probed once per process
+_fts_enabled = {}
+
+def fts5_available(connection):
+    try:
+        connection.exec_driver_sql("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        connection.exec_driver_sql("DROP TABLE temp.fts5_probe")
+        return True
+    except OperationalError:
+        return False
+
+def create_search_index(connection, rebuild=True):
+    if not fts5_available(connection):
+        return False
+    for statement in FTS_STATEMENTS:
+        connection.exec_driver_sql(statement)
+    if rebuild:
+        connection.exec_driver_sql("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
+    return True
+
+def drop_search_index(connection):
+    for statement in DROP_STATEMENTS:
+        connection.exec_driver_sql(statement)
+
+# Fresh databases made with db.create_all() get the index too, not just migrated ones
+@event.listens_for(Posts.__table__, "after_create")
+def _create_index_with_table(target, connection, **kw):
+    _fts_enabled.pop(str(connection.engine.url), None)
+    create_search_index(connection, rebuild=False)
+
+@event.listens_for(Posts.__table__, "before_drop")
+def _drop_index_with_table(target, connection, **kw):
+    _fts_enabled.pop(str(connection.engine.url), None)
+    drop_search_index(connection)
+
+def search_index_enabled():
+    url = str(db.engine.url)
+    if url not in _fts_enabled:
+        with db.engine.connect() as connection:
+            found = connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'"
+            ).first()
+        _fts_enabled[url] = found is not None
+    return _fts_enabled[url]
+
+# Every word becomes a quoted prefix term ("flask"* "rout"*) so user input can
+# never be parsed as FTS5 query syntax; terms are implicitly ANDed
+def build_match_query(term):
+    words = re.findall(r"\w+", term)
+    return " ".join(f'"{word}"*' for word in words)
+
+def _highlight(value):
+    escaped = str(escape(value or ""))
+    return Markup(escaped.replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>"))
+
+class SearchResult:
+    def __init__(self, row):
+        self.id = row.id
+        self.title = row.title
+        self.content = row.content
+        self.author = row.author
+        self.date_posted = row.date_posted
+        self.profile_picture = row.profile_picture
+        self.title_html = _highlight(row.title_html)
+        self.snippet = _highlight(row.snippet)
+
+class SearchPage:
+    def __init__(self, items, page, has_next):
+        self.items = items
+        self.page = page
+        self.has_prev = page > 1
+        self.has_next = has_next
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+# Same interface, over rows still being read from the cursor
+class StreamedSearchPage:
+    def __init__(self, execute, page, per_page):
+        self.rows = StreamedRows(execute, per_page)
+        self.page = page
+        self.has_prev = page > 1
+
+    @property
+    def has_next(self):
+        self.rows.read_all()
+        return self.rows.has_more
+
+    def __iter__(self):
+        return (SearchResult(row) for row in self.rows)
+
+    def __bool__(self):
+        return bool(self.rows)
+
+# <--- SEARCH POSTS --->
+# BM25-ranked FTS5 search over title and content; databases without FTS5 (or
+# without the index yet) fall back to a LIKE scan ordered by title hits first.
+# With stream=True the page is a StreamedSearchPage read from the open cursor
+def search_posts(term, page=1, per_page=10, stream=False):
+    limit, offset = per_page + 1, (page - 1) * per_page
+
+    if search_index_enabled():
+        query = build_match_query(term)
+        if not query:
+            return SearchPage([], page, has_next=False)
+        statement, params = FTS_SEARCH, dict(query=query, limit=limit, offset=offset)
+    else:
+        escaped_term = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = f"%{escaped_term}%"
+        statement, params = LIKE_SEARCH, dict(pattern=pattern, limit=limit, offset=offset)
+
+    if stream:
+        return StreamedSearchPage(
+            lambda: db.session.execute(statement, params, execution_options={"yield_per": limit}),
+            page, per_page)
+    rows = db.session.execute(statement, params).all()
+    results = [SearchResult(row) for row in rows[:per_page]]
+    return SearchPage(results, page, has_next=len(rows) > per_page)
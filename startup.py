@@ -0,0 +1,77 @@
+import gc
+import time
+from contextlib import contextmanager
+import click
+from flask import current_app
+
+# <--- STARTUP PROFILE --->
+# create_app() times each setup step; the result is logged when
+# STARTUP_PROFILE is on and printed by `flask startup-profile`
+class StartupProfile:
+    def __init__(self):
+        self.steps = []
+
+    def add(self, name, seconds):
+        self.steps.append((name, seconds))
+
+    @contextmanager
+    def step(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    @property
+    def total(self):
+        return sum(seconds for _, seconds in self.steps)
+
+    def lines(self, since=0):
+        lines = [f"{seconds * 1000:8.2f} ms  {name}" for name, seconds in self.steps[since:]]
+        lines.append(f"{self.total * 1000:8.2f} ms  total")
+        return lines
+
+    def log(self, logger, since=0):
+        for line in self.lines(since):
+            logger.info("startup %s", line)
+
+@click.command("startup-profile")
+def startup_profile_command():
+    """Show how long each step of create_app() took."""
+    for line in current_app.extensions['startup_profile'].lines():
+        click.echo(line)
+
+# <--- PRE-FORK PRELOAD --->
+# Run in the master before a pre-fork server (gunicorn --preload) forks its
+# workers: do the one-off work once, close pooled connections (SQLite handles
+# must never cross a fork), then freeze the GC so the long-lived objects are
+# never touched by a collection and stay shared copy-on-write.
+def preload(app):
+    profile = app.extensions['startup_profile']
+    first_step = len(profile.steps)
+
+    with profile.step("preload: templates"):
+        from templating import warm_templates
+        if not app.config.get('TEMPLATE_WARMUP'):
+            warm_templates(app)
+
+    # Built before the fork so workers share it copy-on-write
+    with profile.step("preload: typeahead index"):
+        typeahead = app.extensions.get('typeahead')
+        if typeahead is not None:
+            with app.app_context():
+                typeahead.build()
+
+    with profile.step("preload: dispose engines"):
+        db = app.extensions['sqlalchemy']
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+    with profile.step("preload: gc freeze"):
+        gc.collect()
+        gc.freeze()
+
+    if app.config.get('STARTUP_PROFILE'):
+        profile.log(app.logger, since=first_step)
+    return app
@@ -0,0 +1,90 @@
+// Suggestions under the navbar search box, from /search/suggest. Requests wait
+// for a pause in typing and a newer one cancels the last, so each burst of
+// keystrokes costs about one lookup. Enter without a highlighted suggestion
+// still submits the full search.
+(function () {
+    const form = document.querySelector("form[data-suggest-url]");
+    if (!form) return;
+    const input = form.querySelector("input[name=q]");
+    const menu = form.querySelector(".dropdown-menu");
+    const DELAY_MS = 150;
+    const MIN_LENGTH = 2;
+
+    let timer = null;
+    let controller = null;
+    let active = -1;
+
+    function items() {
+        return Array.from(menu.querySelectorAll(".dropdown-item"));
+    }
+
+    function hide() {
+        menu.classList.remove("show");
+        active = -1;
+    }
+
+    function highlight(index) {
+        const links = items();
+        links.forEach((link, i) => link.classList.toggle("active", i === index));
+        active = index;
+    }
+
+    function show(results) {
+        menu.replaceChildren(...results.map(result => {
+            const link = document.createElement("a");
+            link.className = "dropdown-item d-flex justify-content-between gap-3";
+            link.href = result.url;
+            link.setAttribute("role", "option");
+            const label = document.createElement("span");
+            label.className = "text-truncate";
+            label.textContent = result.label;
+            const detail = document.createElement("small");
+            detail.className = "text-muted text-nowrap";
+            detail.textContent = result.kind === "lesson" ? "Lesson" : `by ${result.detail}`;
+            link.append(label, detail);
+            return link;
+        }));
+        active = -1;
+        menu.classList.toggle("show", results.length > 0);
+    }
+
+    function suggest() {
+        const query = input.value.trim();
+        if (controller) controller.abort();
+        if (query.length < MIN_LENGTH) {
+            hide();
+            return;
+        }
+        controller = new AbortController();
+        fetch(`${form.dataset.suggestUrl}?q=${encodeURIComponent(query)}`, { signal: controller.signal })
+            .then(response => response.ok ? response.json() : { results: [] })
+            .then(data => show(data.results))
+            .catch(() => {});
+    }
+
+    input.addEventListener("input", () => {
+        clearTimeout(timer);
+        timer = setTimeout(suggest, DELAY_MS);
+    });
+
+    input.addEventListener("keydown", event => {
+        const links = items();
+        if (!menu.classList.contains("show") || !links.length) return;
+        if (event.key === "ArrowDown") {
+            event.preventDefault();
+            highlight((active + 1) % links.length);
+        } else if (event.key === "ArrowUp") {
+            event.preventDefault();
+            highlight((active - 1 + links.length) % links.length);
+        } else if (event.key === "Enter" && active >= 0) {
+            event.preventDefault();
+            window.location = links[active].href;
+        } else if (event.key === "Escape") {
+            hide();
+        }
+    });
+
+    document.addEventListener("click", event => {
+        if (!form.contains(event.target)) hide();
+    });
+})();
@@ -0,0 +1,144 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import click
+from flask import abort, request, send_file
+from avatars import AVATAR_FOLDER
+
+try:
+    import brotli
+except ImportError:  # gzip-only without the brotli package
+    brotli = None
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE = {".css", ".js", ".map", ".svg", ".json", ".txt", ".html", ".xml", ".ico"}
+# Below this many bytes compression costs more than it saves
+MIN_COMPRESS_SIZE = 256
+
+def fingerprinted_name(filename, digest):
+    base, ext = os.path.splitext(filename)
+    return f"{base}.{digest}{ext}"
+
+# <--- STATIC ASSET PIPELINE --->
+# Every file under static/ gets a content-hashed name (style.css ->
+# style.1a2b3c4d5e6f.css), except static/avatars, which the avatar manifest
+# already serves under content-hashed URLs. url_for('static', filename='style.css') emits the
+# hashed URL through a url_defaults hook, so templates don't change. Hashed
+# URLs are cached as immutable; compressible files also get .gz/.br copies in
+# the build directory, chosen per request from Accept-Encoding.
+class StaticAssets:
+    def __init__(self, app=None):
+        self.app = None
+        self.build_dir = None
+        self.urls = {}
+        self.files = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.build_dir = app.config.get('STATIC_BUILD_DIR') or os.path.join(app.instance_path, "static_build")
+        self.load()
+        if app.config.get('STATIC_PRECOMPRESS', True):
+            try:
+                self.build()
+            except OSError as error:
+                app.logger.warning("Could not precompress static files: %s", error)
+        app.url_defaults(self.inject_hashed_name)
+        app.view_functions['static'] = self.serve
+        app.cli.add_command(build_static_command)
+        app.extensions['static_assets'] = self
+
+    def load(self):
+        root = self.app.static_folder
+        skipped = os.path.normpath(os.path.join(self.app.root_path, AVATAR_FOLDER))
+        self.urls = {}
+        self.files = {}
+        for folder, folders, names in os.walk(root):
+            folders[:] = [name for name in folders if os.path.join(folder, name) != skipped]
+            for name in names:
+                path = os.path.join(folder, name)
+                filename = os.path.relpath(path, root).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()[:12]
+                hashed = fingerprinted_name(filename, digest)
+                self.urls[filename] = hashed
+                self.files[hashed] = filename
+
+    # Writes <build dir>/<hashed name>.gz and .br; the name carries the content
+    # hash, so files that already exist are up to date
+    def build(self, force=False):
+        written = []
+        for hashed, filename in self.files.items():
+            if os.path.splitext(filename)[1] not in COMPRESSIBLE:
+                continue
+            with open(os.path.join(self.app.static_folder, filename), "rb") as f:
+                data = f.read()
+            if len(data) < MIN_COMPRESS_SIZE:
+                continue
+            for suffix, compress in self._encoders():
+                target = os.path.join(self.build_dir, hashed + suffix)
+                if os.path.exists(target) and not force:
+                    continue
+                compressed = compress(data)
+                if len(compressed) >= len(data):
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target + ".tmp", "wb") as f:
+                    f.write(compressed)
+                os.replace(target + ".tmp", target)
+                written.append(target)
+        return written
+
+    @staticmethod
+    def _encoders():
+        encoders = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            encoders.insert(0, (".br", lambda data: brotli.compress(data, quality=11)))
+        return encoders
+
+    def inject_hashed_name(self, endpoint, values):
+        if endpoint == "static" and "filename" in values:
+            hashed = self.urls.get(values["filename"])
+            if hashed is not None:
+                values["filename"] = hashed
+
+    def url(self, filename):
+        return self.urls.get(filename, filename)
+
+    def serve(self, filename):
+        original = self.files.get(filename)
+        if original is None:
+            # Unhashed path: plain file, revalidated on every use
+            return self.app.send_static_file(filename)
+
+        response = None
+        encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+        encoding = request.accept_encodings.best_match(encodings)
+        if encoding is not None:
+            path = os.path.join(self.build_dir, filename + (".br" if encoding == "br" else ".gz"))
+            if os.path.isfile(path):
+                mimetype = mimetypes.guess_type(original)[0] or "application/octet-stream"
+                response = send_file(path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+                response.headers["Content-Encoding"] = encoding
+        if response is None:
+            path = os.path.join(self.app.static_folder, original)
+            if not os.path.isfile(path):
+                abort(404)
+            response = send_file(path, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add("Accept-Encoding")
+        return response
+
+static_assets = StaticAssets()
+
+@click.command("build-static")
+@click.option("--force", is_flag=True, help="Rewrite compressed files that already exist")
+def build_static_command(force):
+    """Fingerprint static files and write their gzip/brotli copies."""
+    static_assets.load()
+    written = static_assets.build(force=force)
+    click.echo(f"Fingerprinted {len(static_assets.files)} files, wrote {len(written)} compressed copies "
+               f"to {static_assets.build_dir}")
@@ -0,0 +1,153 @@
+from flask import Response, current_app, g, render_template, stream_with_context
+from flask.globals import app_ctx, request_ctx
+from flask.signals import before_render_template, template_rendered
+from markupsafe import Markup
+
+# Emitted by {{ stream_flush() }} in base.html; never reaches the browser
+FLUSH_MARKER = "\x00flush\x00"
+
+# <--- STREAMED PAGES --->
+# The page is sent while the template renders: everything up to the
+# stream_flush() marker (head, stylesheets, nav, flashed messages) goes out as
+# the first chunk, so the browser starts fetching CSS while rows are still
+# being read, and the rest follows in chunks of about STREAM_CHUNK_SIZE
+# characters. Once the first chunk is out the status is fixed, so anything that
+# can fail with a 4xx belongs in the view, before render_streamed() is called.
+#
+# Flask tears the request down when the view returns and again when the body
+# is finished. The session is removed the first time, so streamed rows are
+# queried from inside the body; hooks that hold something for the whole
+# request (admission slots, the profiler, metrics) check stream_open() and
+# wait for the second teardown.
+def streaming_enabled():
+    return current_app.config.get('STREAM_TEMPLATES', True)
+
+def stream_open():
+    return g.get("stream_open", False)
+
+def render_streamed(template_name, **context):
+    if not streaming_enabled():
+        return render_template(template_name, **context)
+    app = current_app._get_current_object()
+    template = app.jinja_env.get_or_select_template(template_name)
+    app.update_template_context(context)
+    chunk_size = app.config.get('STREAM_CHUNK_SIZE', 8192)
+    g.streaming = True
+
+    def body():
+        before_render_template.send(app, template=template, context=context)
+        yield from _chunks(template.generate(context), chunk_size)
+        template_rendered.send(app, template=template, context=context)
+
+    return stream_response(body(), mimetype="text/html")
+
+# Any streamed body: `chunks` should be a generator that has not started yet,
+# so its queries run inside the body (see above)
+def stream_response(chunks, **kwargs):
+    g.stream_open = True
+
+    def body():
+        try:
+            yield from chunks
+        finally:
+            g.stream_open = False
+
+    response = Response(stream_with_context(body()), **kwargs)
+    # Stop nginx holding the chunks back until the body is complete
+    response.headers["X-Accel-Buffering"] = "no"
+    response.call_on_close(_teardown_unsent(app_ctx._get_current_object(), request_ctx._get_current_object()))
+    return response
+
+# A client that goes away before the first chunk means the body never ran;
+# push the request once more so the deferred teardown still happens
+def _teardown_unsent(app_context, request_context):
+    def close():
+        if app_context.g.get("stream_open"):
+            with app_context, request_context:
+                g.stream_open = False
+    return close
+
+def _chunks(parts, chunk_size):
+    buffered, size = [], 0
+    for part in parts:
+        if FLUSH_MARKER in part:
+            before, after = part.split(FLUSH_MARKER, 1)
+            buffered.append(before)
+            yield "".join(buffered)
+            buffered, size = [after], len(after)
+            continue
+        buffered.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield "".join(buffered)
+            buffered, size = [], 0
+    if buffered:
+        yield "".join(buffered)
+
+def stream_flush():
+    return Markup(FLUSH_MARKER) if g.get("streaming") else ""
+
+def init_streaming(app):
+    app.add_template_global(stream_flush, "stream_flush")
+
+# <--- LAZY RESULT PAGES --->
+# `execute` runs the query when the first row is wanted, inside the streamed
+# body, and rows are pulled from the cursor as the template loops over them.
+# Whether there is another page is known once the extra (per_page + 1) row has
+# been looked for, which templates only ask after the loop; asking earlier
+# reads the remaining rows ahead, so the answer is always right.
+class StreamedRows:
+    def __init__(self, execute, per_page):
+        self._execute = execute
+        self._result = None
+        self._rows = None
+        self._per_page = per_page
+        self._ahead = []
+        self._read = 0
+        self._done = False
+        self.has_more = False
+        self.first = None
+        self.last = None
+
+    def _fetch(self):
+        if self._done:
+            return None
+        if self._result is None:
+            self._result = self._execute()
+            self._rows = iter(self._result)
+        row = next(self._rows, None)
+        if row is not None and self._read == self._per_page:
+            self.has_more = True
+            row = None
+        if row is None:
+            self._done = True
+            # Hand the cursor back before the rest of the page renders
+            self._result.close()
+            return None
+        self._read += 1
+        if self.first is None:
+            self.first = row
+        self.last = row
+        return row
+
+    def read_all(self):
+        while self._fetch_ahead():
+            pass
+
+    def _fetch_ahead(self):
+        row = self._fetch()
+        if row is not None:
+            self._ahead.append(row)
+        return row is not None
+
+    def __iter__(self):
+        while self._ahead:
+            yield self._ahead.pop(0)
+        while True:
+            row = self._fetch()
+            if row is None:
+                return
+            yield row
+
+    def __bool__(self):
+        return self.first is not None or self._fetch_ahead()
@@ -0,0 +1,55 @@
+import os
+import time
+import click
+from jinja2 import FileSystemBytecodeCache
+
+# <--- JINJA BYTECODE CACHE --->
+# Compiled templates are written to disk and shared by every worker. Jinja keys
+# each file on the template's source checksum, so editing a template simply
+# produces a new cache entry.
+def init_templating(app):
+    if app.config.get('JINJA_BYTECODE_CACHE', True):
+        directory = app.config.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(app.instance_path, "jinja_cache")
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory, pattern="flaskify_%s.cache")
+
+    app.cli.add_command(warm_templates_command)
+
+    if app.config.get('TEMPLATE_WARMUP'):
+        report = warm_templates(app)
+        log_report(app, report)
+
+# Load (and compile, or read from the bytecode cache) every template up front
+# so the first real request doesn't pay for it; returns [(name, seconds)]
+def warm_templates(app, prerender_lessons=True):
+    env = app.jinja_env
+    report = []
+    for name in env.list_templates(filter_func=lambda n: n.endswith(".html")):
+        started = time.perf_counter()
+        env.get_template(name)
+        report.append((name, time.perf_counter() - started))
+
+    lesson_pages = app.extensions.get('lesson_pages')
+    if prerender_lessons and lesson_pages is not None:
+        started = time.perf_counter()
+        lesson_pages.prerender()
+        report.append(("<prerender lessons>", time.perf_counter() - started))
+    return report
+
+def log_report(app, report, slowest=5):
+    total = sum(seconds for _, seconds in report)
+    app.logger.info("Warmed %d templates in %.1f ms", len(report), total * 1000)
+    for name, seconds in sorted(report, key=lambda item: item[1], reverse=True)[:slowest]:
+        app.logger.info("  %-40s %.2f ms", name, seconds * 1000)
+
+@click.command("warm-templates")
+@click.option("--cold", is_flag=True, help="Ignore the bytecode cache to measure full compile cost")
+def warm_templates_command(cold):
+    """Load every template and report how long each one took."""
+    from flask import current_app
+    if cold:
+        current_app.jinja_env.bytecode_cache = None
+    report = warm_templates(current_app)
+    for name, seconds in sorted(report, key=lambda item: item[1], reverse=True):
+        click.echo(f"{seconds * 1000:8.2f} ms  {name}")
+    click.echo(f"{sum(seconds for _, seconds in report) * 1000:8.2f} ms  total ({len(report)} templates)")
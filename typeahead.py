@@ -0,0 +1,219 @@
+import bisect
+import heapq
+import re
+import sys
+import threading
+import time
+import unicodedata
+from flask import request, url_for
+from sqlalchemy import select
+from models import db, Posts
+from valid_url import COURSE_ORDER, LESSON_TITLES
+
+WORD = re.compile(r"\w+")
+
+# Per lookup at most: distinct words merged, and candidates checked against
+# the rest of the query, so a one-letter prefix stays as cheap as a long one
+MAX_WORDS = 500
+MAX_SCAN = 2000
+MAX_QUERY_LENGTH = 100
+
+# Lower-cased, accents dropped, split into words: "Crème Brûlée" ->
+# ["creme", "brulee"], so typing either spelling finds it
+def words(text):
+    text = unicodedata.normalize("NFKD", text or "").casefold()
+    return WORD.findall("".join(c for c in text if not unicodedata.combining(c)))
+
+def _entry(kind, label, detail, target, *texts):
+    return (kind, label, detail, target, tuple(sorted({sys.intern(w) for text in texts for w in words(text)})))
+
+def _post_entry(post_id, title, author):
+    return _entry("post", title, author, post_id, title, author)
+
+# <--- PREFIX INDEX --->
+# Every word of every post title, post author and lesson title, kept as a
+# sorted list of distinct words and, per word, a sorted list of the refs using
+# it. Refs sort lessons first, in course order, then posts newest first, which
+# is the order suggestions are shown in: a lookup bisects to the words starting
+# with the prefix and merges their ref lists only until enough suggestions are
+# found, with no SQL. The index is built once per process (before the fork
+# under wsgi.py, else by the first lookup while any others wait for it);
+# add_post/edit_post/delete_post update it in place, and it is rebuilt in the
+# background every TYPEAHEAD_REBUILD_INTERVAL seconds to pick up posts written
+# by other workers. Posting lists are replaced rather than changed, so a lookup
+# only holds the lock to pick its lists and merges them after releasing it.
+class TypeaheadIndex:
+    def __init__(self, app=None):
+        self.app = None
+        self.limit = 8
+        self.rebuild_interval = 300
+        self._lock = threading.Lock()
+        # Held for a whole build, so two never run at once
+        self._build_lock = threading.Lock()
+        self._words = []
+        self._postings = {}
+        # ref -> (kind, label, detail, target, words)
+        self._entries = {}
+        self._built = None
+        # Changes made while a rebuild reads the tables, replayed onto its result
+        self._changes = None
+        self.lookups = 0
+        self.rebuilds = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.limit = app.config.get('TYPEAHEAD_RESULTS', self.limit)
+        self.rebuild_interval = app.config.get('TYPEAHEAD_REBUILD_INTERVAL', self.rebuild_interval)
+        self._words = []
+        self._postings = {}
+        self._entries = {}
+        self._built = None
+        app.add_url_rule('/search/suggest', 'search_suggest', self.view)
+        app.extensions['typeahead'] = self
+
+    # <--- BUILDING --->
+    # Needs an app context; returns the number of entries
+    def build(self):
+        with self._build_lock:
+            return self._build()
+
+    def _build(self):
+        with self._lock:
+            self._changes = []
+        try:
+            entries = {(0, index): _entry("lesson", LESSON_TITLES[lesson], None, lesson, LESSON_TITLES[lesson])
+                       for index, lesson in enumerate(COURSE_ORDER)}
+            rows = db.session.execute(select(Posts.id, Posts.title, Posts.author),
+                                      execution_options={"yield_per": 1000})
+            for post_id, title, author in rows:
+                entries[(1, -post_id)] = _post_entry(post_id, title, author)
+            postings = {}
+            for ref in sorted(entries):
+                for word in entries[ref][4]:
+                    postings.setdefault(word, []).append(ref)
+        except Exception:
+            with self._lock:
+                self._changes = None
+            raise
+
+        with self._lock:
+            changes, self._changes = self._changes, None
+            self._words, self._postings, self._entries = sorted(postings), postings, entries
+            for ref, entry in changes:
+                self._remove(ref)
+                if entry is not None:
+                    self._add(ref, entry)
+            self._built = time.monotonic()
+            self.rebuilds += 1
+            return len(self._entries)
+
+    def _refresh(self):
+        if self._built is None:
+            with self._build_lock:
+                if self._built is None:
+                    self._build()
+        elif (self.rebuild_interval and self._changes is None
+              and time.monotonic() - self._built > self.rebuild_interval):
+            # Lookups keep using the current index meanwhile
+            self._built = time.monotonic()
+            threading.Thread(target=self._rebuild, name="typeahead-rebuild", daemon=True).start()
+
+    def _rebuild(self):
+        with self.app.app_context():
+            try:
+                self.build()
+            except Exception:
+                self.app.logger.exception("Could not rebuild the typeahead index")
+
+    # <--- UPDATES --->
+    # Lists a lookup may still be merging are copied, not changed
+    def _add(self, ref, entry):
+        self._entries[ref] = entry
+        for word in entry[4]:
+            refs = self._postings.get(word)
+            if refs is None:
+                self._postings[word] = [ref]
+                bisect.insort(self._words, word)
+            else:
+                i = bisect.bisect_left(refs, ref)
+                self._postings[word] = refs[:i] + [ref] + refs[i:]
+
+    def _remove(self, ref):
+        entry = self._entries.pop(ref, None)
+        if entry is None:
+            return
+        for word in entry[4]:
+            refs = self._postings[word]
+            if len(refs) == 1:
+                del self._postings[word]
+                del self._words[bisect.bisect_left(self._words, word)]
+            else:
+                i = bisect.bisect_left(refs, ref)
+                self._postings[word] = refs[:i] + refs[i + 1:]
+
+    def _change(self, ref, entry):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((ref, entry))
+            self._remove(ref)
+            if entry is not None:
+                self._add(ref, entry)
+
+    # Called after the post's transaction has committed
+    def add_post(self, post):
+        self._change((1, -post.id), _post_entry(post.id, post.title, post.author))
+
+    def remove_post(self, post_id):
+        self._change((1, -post_id), None)
+
+    # <--- LOOKUP --->
+    # Entries with a word starting with each word of `query`; the longest one
+    # picks the candidates, the others are checked against each candidate's words
+    def lookup(self, query, limit=None):
+        tokens = words(query[:MAX_QUERY_LENGTH])
+        if not tokens:
+            return []
+        self._refresh()
+        limit = limit or self.limit
+        prefix = max(tokens, key=len)
+        tokens.remove(prefix)
+        with self._lock:
+            self.lookups += 1
+            start = bisect.bisect_left(self._words, prefix)
+            runs = []
+            for word in self._words[start:start + MAX_WORDS]:
+                if not word.startswith(prefix):
+                    break
+                runs.append(self._postings[word])
+            entries = self._entries
+
+        found = []
+        previous = None
+        for scanned, ref in enumerate(heapq.merge(*runs)):
+            if scanned == MAX_SCAN or len(found) == limit:
+                break
+            # A ref under two matching words comes out twice in a row
+            if ref == previous:
+                continue
+            previous = ref
+            # None when the post was deleted since the lists were picked
+            entry = entries.get(ref)
+            if entry is not None and all(any(word.startswith(token) for word in entry[4]) for token in tokens):
+                found.append(entry)
+        return found
+
+    def view(self):
+        results = []
+        for kind, label, detail, target, _ in self.lookup(request.args.get("q", "")):
+            url = url_for('lesson', lesson=target) if kind == "lesson" else url_for('post', id=target)
+            results.append({"kind": kind, "label": label, "detail": detail, "url": url})
+        return {"results": results}
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "words": len(self._words),
+                    "lookups": self.lookups, "rebuilds": self.rebuilds}
+
+typeahead_index = TypeaheadIndex()
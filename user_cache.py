@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+
+SNAPSHOT_FIELDS = ("id", "name", "email", "bio", "profile_picture",
+                   "aspiring_job", "date_added", "progress")
+
+# Read-only copy of a Users row, safe to share between requests and threads.
+# Anything that needs to change a user must load the Users row itself.
+class UserSnapshot(UserMixin):
+    __slots__ = SNAPSHOT_FIELDS
+
+    def __init__(self, user):
+        for field in SNAPSHOT_FIELDS:
+            value = getattr(user, field)
+            if field == "progress":
+                value = tuple(value or ())
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"UserSnapshot is read-only, cannot set {name!r}")
+
+    def __repr__(self):
+        return f"<UserSnapshot {self.id}>"
+
+# <--- USER IDENTITY CACHE --->
+# LRU + TTL cache of UserSnapshots used by the login manager's user_loader.
+# Each worker has its own copy: writes in this process invalidate immediately,
+# other workers catch up when their entry's TTL runs out.
+class UserCache:
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.max_size = app.config.get('USER_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        user = loader(user_id)
+        if user is None or self.max_size <= 0:
+            return None if user is None else UserSnapshot(user)
+        snapshot = UserSnapshot(user)
+
+        with self._lock:
+            self._entries[user_id] = (snapshot, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return snapshot
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+user_cache = UserCache()
@@ -1,8 +1,36 @@
-def is_valid(lesson):
+import html
+import os
+import re
+
+LESSON_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "lessons")
+
+# Built once from the templates on disk, so a new lesson file is valid without
+# touching this module
+LESSONS = frozenset(
+    filename[:-len(".html")]
+    for filename in os.listdir(LESSON_FOLDER)
+    if filename.endswith(".html")
+)
+
+def _dashboard():
+    with open(os.path.join(os.path.dirname(LESSON_FOLDER), "dashboard.html")) as f:
+        return f.read()
+
+# Course order as laid out on the dashboard; lessons missing from it go last
+def _course_order():
+    listed = re.findall(r'data-lesson-id="([^"]+)"', _dashboard())
+    ordered = list(dict.fromkeys(lesson for lesson in listed if lesson in LESSONS))
+    return tuple(ordered + sorted(LESSONS - set(ordered)))
 
-    list = ["lesson_zero", "lesson_one", "lesson_two", "lesson_three", "lesson_four", "lesson_five",
-            "lesson_six", "lesson_seven", "lesson_eight", "lesson_nine", "lesson_ten", "lesson_eleven"
-            "lesson_twelve", "lesson_thirteen", "lesson_fourteen", "lesson_fifteen", "lesson_sixteen",
-            "lesson_seventeen", "lesson_eighteen", "lesson_nineteen", "lesson_twenty", "project_one", "project_two"]
-    
-    return lesson in list
\ No newline at end of file
+COURSE_ORDER = _course_order()
+
+# Lesson titles as linked on the dashboard ("lesson_two" -> "Routes & Views")
+def _lesson_titles():
+    linked = dict(re.findall(r"url_for\('lesson', lesson='([^']+)'\)\s*\}\}\"[^>]*>([^<]+)<", _dashboard()))
+    return {lesson: html.unescape(linked[lesson].strip()) if lesson in linked else lesson.replace("_", " ").capitalize()
+            for lesson in LESSONS}
+
+LESSON_TITLES = _lesson_titles()
+
+def is_valid(lesson):
+    return lesson in LESSONS
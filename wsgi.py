@@ -0,0 +1,7 @@
+# Entry point for pre-fork servers, e.g.
+#   gunicorn --preload --workers 4 --worker-class gthread --threads 32 wsgi:app
+# The app is built and preloaded once in the master; workers inherit it.
+from app import create_app
+from startup import preload
+
+app = preload(create_app())